@@ -0,0 +1,113 @@
+"""Split a clip holding two utterances at the pause between them.
+
+tts.speak_pair asks for a note's two texts (word and sentence, or question
+and answer) in one synthesis, with a long pause between them, and cuts the
+clip here. ffmpeg's silencedetect lists the silences inside the clip; the
+cut goes in the middle of the longest one. The split is refused, so the
+caller falls back to one synthesis per text, when there is no pause, when
+another pause is nearly as long (SPLIT_AMBIGUITY_RATIO), or when either
+part would be shorter than SPLIT_MIN_PART_SECONDS.
+
+Requires ffmpeg on PATH; without it nothing is split.
+"""
+import os
+import re
+import shutil
+import subprocess
+
+# The pause asked for between the two texts.
+PAIR_PAUSE_SECONDS = 2
+SPLIT_NOISE = os.getenv("SPLIT_NOISE", "-40dB")
+SPLIT_MIN_PAUSE_SECONDS = float(os.getenv("SPLIT_MIN_PAUSE_SECONDS", "0.6"))
+SPLIT_MIN_PART_SECONDS = float(os.getenv("SPLIT_MIN_PART_SECONDS", "0.2"))
+SPLIT_AMBIGUITY_RATIO = float(os.getenv("SPLIT_AMBIGUITY_RATIO", "0.7"))
+
+# Silences closer than this to either end are padding, not the pause.
+EDGE_SECONDS = 0.05
+# ffmpeg picks the muxer from the extension, but cache temp files end in .part.
+FORMATS = {".mp3": "mp3", ".m4a": "mp4", ".wav": "wav", ".ogg": "ogg"}
+
+DURATION = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+SILENCE_START = re.compile(r'silence_start: (-?\d+(?:\.\d+)?)')
+SILENCE_END = re.compile(r'silence_end: (-?\d+(?:\.\d+)?)')
+
+
+def available():
+    return shutil.which("ffmpeg") is not None
+
+
+def find_silences(path):
+    """Return (duration, [(start, end), ...]) for the silences ffmpeg finds in path."""
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-hide_banner", "-i", str(path),
+         "-af", f"silencedetect=noise={SPLIT_NOISE}:d={SPLIT_MIN_PAUSE_SECONDS}", "-f", "null", "-"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"ffmpeg exited with {result.returncode}")
+    return parse_silences(result.stderr)
+
+
+def parse_silences(output):
+    """Parse silencedetect's log into (duration, silences)."""
+    match = DURATION.search(output)
+    if match is None:
+        raise RuntimeError("ffmpeg did not report a duration")
+    hours, minutes, seconds = match.groups()
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    silences = []
+    start = None
+    for line in output.splitlines():
+        started = SILENCE_START.search(line)
+        ended = SILENCE_END.search(line)
+        if started:
+            start = max(0.0, float(started.group(1)))
+        elif ended and start is not None:
+            silences.append((start, float(ended.group(1))))
+            start = None
+    if start is not None:
+        silences.append((start, duration))  # silence running to the end of the clip
+    return duration, silences
+
+
+def split_point(duration, silences):
+    """Return where to cut a clip of duration with silences, or None if the pause is ambiguous."""
+    pauses = sorted(
+        (
+            (start, end) for start, end in silences
+            if start > EDGE_SECONDS and end < duration - EDGE_SECONDS
+        ),
+        key=lambda pause: pause[1] - pause[0], reverse=True,
+    )
+    if not pauses:
+        return None
+    start, end = pauses[0]
+    if len(pauses) > 1 and pauses[1][1] - pauses[1][0] >= SPLIT_AMBIGUITY_RATIO * (end - start):
+        return None
+    if start < SPLIT_MIN_PART_SECONDS or duration - end < SPLIT_MIN_PART_SECONDS:
+        return None
+    return (start + end) / 2
+
+
+def cut(source, destination, extension, start=None, end=None):
+    command = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-i", str(source)]
+    if start is not None:
+        command += ["-ss", f"{start:.3f}"]
+    if end is not None:
+        command += ["-to", f"{end:.3f}"]
+    command += ["-map_metadata", "-1", "-f", FORMATS[extension], str(destination)]
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(e.stderr.strip() or f"ffmpeg exited with {e.returncode}") from None
+
+
+def split_at_pause(source, first_path, second_path, extension):
+    """Write the parts of source before and after its pause; return False if the pause is ambiguous."""
+    duration, silences = find_silences(source)
+    point = split_point(duration, silences)
+    if point is None:
+        return False
+    cut(source, first_path, extension, end=point)
+    cut(source, second_path, extension, start=point)
+    return True
@@ -0,0 +1,127 @@
+"""Normalize all TTS output to one compact audio profile before packaging.
+
+Audio arrives as OpenAI mp3, Narakeet m4a and ElevenLabs 64 kbps mp3, with
+different bitrates and loudness. transcode_audio runs every clip through
+ffmpeg in parallel: leading and trailing silence is trimmed, loudness is
+normalized, and the result is encoded with the shared profile picked by
+the AUDIO_PROFILE environment variable.
+Results are cached under <audio_dir>/transcoded/<profile>-<filters>/,
+where <filters> is a short hash of the filter chain, and are named after
+the source file's content hash. Re-runs only process new clips, and
+retuning the silence trim or loudness targets starts a fresh cache.
+
+Requires ffmpeg on PATH; without it the original clips are packaged.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import metrics
+
+PROFILES = {
+    # Mono low-bitrate mp3 plays everywhere Anki runs, including iOS.
+    "mp3": {"codec": "libmp3lame", "bitrate": "48k", "sample_rate": 24000, "extension": ".mp3"},
+    # Smaller still, but AnkiMobile cannot play Ogg Opus.
+    "opus": {"codec": "libopus", "bitrate": "24k", "sample_rate": 24000, "extension": ".ogg"},
+}
+AUDIO_PROFILE_NAME = os.getenv("AUDIO_PROFILE", "mp3")
+
+SILENCE_THRESHOLD = "-50dB"
+# Trim silence at the start, reverse and trim again for the end, then
+# normalize to a speech-friendly loudness target.
+FILTERS = ",".join([
+    f"silenceremove=start_periods=1:start_threshold={SILENCE_THRESHOLD}:start_silence=0.05",
+    "areverse",
+    f"silenceremove=start_periods=1:start_threshold={SILENCE_THRESHOLD}:start_silence=0.05",
+    "areverse",
+    "loudnorm=I=-16:TP=-1.5:LRA=11",
+])
+
+# Part of the output directory name, so clips are redone when FILTERS change.
+FILTERS_HASH = hashlib.sha256(FILTERS.encode('utf-8')).hexdigest()[:8]
+
+CHUNK_SIZE = 64 * 1024
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def transcode_one(source, destination, profile):
+    # Unique per call, so concurrent builds of the same output do not share it;
+    # the extension stays last so ffmpeg can infer the format.
+    destination = Path(destination)
+    tmp_path = destination.with_name(f"{destination.stem}.{os.getpid()}.{threading.get_ident()}.part{profile['extension']}")
+    command = [
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(source),
+        "-af", FILTERS,
+        "-ac", "1",
+        "-ar", str(profile["sample_rate"]),
+        "-c:a", profile["codec"],
+        "-b:a", profile["bitrate"],
+        "-map_metadata", "-1",
+        str(tmp_path),
+    ]
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        tmp_path.unlink(missing_ok=True)
+        raise RuntimeError(e.stderr.strip() or f"ffmpeg exited with {e.returncode}") from None
+    os.replace(tmp_path, destination)
+    return destination
+
+
+@metrics.timed("transcode_audio")
+def transcode_audio(audio_dir, file_names, profile_name=AUDIO_PROFILE_NAME, workers=None):
+    """Return {file name: path to package} for the given clips in audio_dir.
+
+    Clips that cannot be transcoded map to their original path.
+    """
+    audio_dir = Path(audio_dir)
+    sources = {name: audio_dir / name for name in set(file_names) if name}
+    if shutil.which("ffmpeg") is None:
+        print("ffmpeg is not installed; packaging audio without transcoding it.")
+        return sources
+
+    profile = PROFILES[profile_name]
+    out_dir = audio_dir / "transcoded" / f"{profile_name}-{profile['bitrate']}-{FILTERS_HASH}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    transcoded = {}
+    jobs = {}
+    cached = 0
+    for name, source in sources.items():
+        if not source.exists():
+            transcoded[name] = source
+            continue
+        destination = out_dir / f"{file_hash(source)[:32]}{profile['extension']}"
+        if destination.exists():
+            transcoded[name] = destination
+            cached += 1
+        else:
+            jobs[name] = (source, destination)
+
+    if jobs:
+        print(f"Transcoding {len(jobs)} audio clips ({cached} already cached)")
+        # ffmpeg does the work in its own process, so threads are enough.
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = {
+                name: executor.submit(transcode_one, source, destination, profile)
+                for name, (source, destination) in jobs.items()
+            }
+            for name, future in futures.items():
+                try:
+                    transcoded[name] = future.result()
+                except Exception as e:
+                    print(f"Error transcoding audio '{name}': {e}")
+                    transcoded[name] = sources[name]
+    return transcoded
@@ -0,0 +1,288 @@
+"""Offline batch mode for bulk translation and audio generation.
+
+Splits generation into a submit phase, which serializes every pending
+request into a job file in the OpenAI Batch API input format, and a collect
+phase, which ingests the matching results file into the note store. A
+typical overnight run looks like:
+
+    python batch_jobs.py submit-translations jobs/translations.jsonl --upload
+    python batch_jobs.py download <batch id> jobs/translations.results.jsonl
+    python batch_jobs.py collect-translations jobs/translations.jsonl jobs/translations.results.jsonl
+    python batch_jobs.py submit-audio jobs/audio.jsonl --upload
+    python batch_jobs.py download <batch id> jobs/audio.results.jsonl
+    python batch_jobs.py collect-audio jobs/audio.jsonl jobs/audio.results.jsonl
+
+Without --upload the job file is only written, which is what batch_stub.py
+expects for a local dry run. Requests that failed are written to
+<results>.errors.jsonl and stay pending for the next submit.
+"""
+import argparse
+import base64
+import json
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+import images
+import tts
+from media_cache import make_key, open_cache
+from note_store import open_store
+from romanize import romanize
+from translation import TRANSLATION_MODEL, TRANSLATION_VERSION, TranslationResponse, remember_translation, response_format, translation_messages
+from word_lists import read_words
+
+ENDPOINT = "/v1/chat/completions"
+WORDS_FILE = Path('1000-most-common-nepali-words.txt')
+
+image_dir = Path(r"C:\anki_images")
+audio_dir = Path(r"C:\anki_audio")
+notes_file = Path(r"processed_notes.json")
+
+
+def write_job(job_file, bodies):
+    """Write {custom_id: request body} as a Batch API input file."""
+    job_file = Path(job_file)
+    job_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(job_file, 'w', encoding='utf-8') as f:
+        for custom_id, body in bodies.items():
+            f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body}, ensure_ascii=False) + '\n')
+    print(f"Wrote {len(bodies)} requests to {job_file}")
+
+
+def read_job(job_file):
+    with open(job_file, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_results(results_file):
+    """Return {custom_id: (response body, error message)} from a Batch API output file."""
+    results = {}
+    with open(results_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error"):
+                results[result["custom_id"]] = (None, result["error"].get("message", "error"))
+            elif response.get("status_code") != 200:
+                results[result["custom_id"]] = (None, f"HTTP {response.get('status_code')}")
+            else:
+                results[result["custom_id"]] = (response["body"], None)
+    return results
+
+
+def write_errors(results_file, errors):
+    errors_file = Path(results_file).with_suffix('.errors.jsonl')
+    with open(errors_file, 'w', encoding='utf-8') as f:
+        for custom_id, reason in errors:
+            f.write(json.dumps({"custom_id": custom_id, "error": reason}, ensure_ascii=False) + '\n')
+    return errors_file
+
+
+def report(counts, errors, results_file):
+    print(", ".join(f"{name}: {count}" for name, count in sorted(counts.items())))
+    if errors:
+        print(f"{len(errors)} failed requests written to {write_errors(results_file, errors)}")
+
+
+def submit_translations(job_file):
+    store = open_store(notes_file)
+    bodies = {}
+    for nepali_word, _ in read_words(WORDS_FILE):
+        if nepali_word not in store:
+            bodies[f"translate:{nepali_word}"] = {
+                "model": TRANSLATION_MODEL,
+                "messages": translation_messages(nepali_word),
+                "response_format": response_format(TranslationResponse),
+            }
+    write_job(job_file, bodies)
+
+
+def collect_translations(job_file, results_file):
+    store = open_store(notes_file)
+    results = read_results(results_file)
+    counts = Counter()
+    errors = []
+
+    # Walk the job file rather than the results so notes are numbered in
+    # submission order, whatever order the batch finished in.
+    parsed_words = []
+    for request in read_job(job_file):
+        custom_id = request["custom_id"]
+        nepali_word = custom_id.split(':', 1)[1]
+        if nepali_word in store:
+            counts["already stored"] += 1
+            continue
+        if custom_id not in results:
+            counts["missing"] += 1
+            errors.append((custom_id, "missing from results"))
+            continue
+        body, error = results[custom_id]
+        if error:
+            counts["failed"] += 1
+            errors.append((custom_id, error))
+            continue
+        try:
+            parsed = TranslationResponse.model_validate_json(body["choices"][0]["message"]["content"])
+        except (KeyError, IndexError, TypeError, ValidationError) as e:
+            counts["malformed"] += 1
+            errors.append((custom_id, f"malformed response: {e}"))
+            continue
+        remember_translation(nepali_word, parsed)
+        parsed_words.append((nepali_word, parsed))
+
+    # Pixabay has no batch endpoint, but it is free and fast, so images are
+    # fetched here rather than in a separate job.
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        image_files = executor.map(lambda item: images.fetch_image(item[1].english_meaning, image_dir), parsed_words)
+        index = store.next_index()
+        for (nepali_word, parsed), image_file_name in zip(parsed_words, image_files):
+            store.upsert({
+                "index": index,
+                "nepali": nepali_word,
+                "romanized": romanize(nepali_word),
+                "english": parsed.english_meaning,
+                "sentence": parsed.nepali_sentence,
+                "romanized_sentence": romanize(parsed.nepali_sentence, sentence=True),
+                "english_sentence": parsed.english_sentence,
+                "image": image_file_name or '',
+                "word_audio": '',
+                "sentence_audio": '',
+                **TRANSLATION_VERSION,
+            })
+            index += 1
+            counts["stored"] += 1
+
+    store.save()
+    report(counts, errors, results_file)
+
+
+def audio_texts(note):
+    """(field, text) pairs still missing audio for a note."""
+    texts = [("word_audio", note["nepali"]), ("sentence_audio", note["sentence"])]
+    return [(field, text) for field, text in texts if not note.get(field) and text and text != "N/A"]
+
+
+def audio_custom_id(text):
+    return "audio:" + make_key("openai", tts.OPENAI_AUDIO_CACHE_VOICE, tts.clean_text(text))[:32]
+
+
+def submit_audio(job_file):
+    store = open_store(notes_file)
+    audio_cache = open_cache(audio_dir)
+    bodies = {}
+    for note in store:
+        for field, text in audio_texts(note):
+            cleaned_text = tts.clean_text(text)
+            if audio_cache.get("openai", tts.OPENAI_AUDIO_CACHE_VOICE, cleaned_text):
+                continue  # collect-audio picks this up straight from the cache
+            # Identical texts share one request.
+            bodies[audio_custom_id(text)] = tts.openai_audio_request(text)
+    write_job(job_file, bodies)
+
+
+def collect_audio(job_file, results_file):
+    store = open_store(notes_file)
+    audio_cache = open_cache(audio_dir)
+    results = read_results(results_file)
+    counts = Counter()
+    errors = []
+
+    for request in read_job(job_file):
+        custom_id = request["custom_id"]
+        text = request["body"]["messages"][-1]["content"]
+        if custom_id not in results:
+            counts["missing"] += 1
+            errors.append((custom_id, "missing from results"))
+            continue
+        body, error = results[custom_id]
+        if error:
+            counts["failed"] += 1
+            errors.append((custom_id, error))
+            continue
+        try:
+            audio_data = base64.b64decode(body["choices"][0]["message"]["audio"]["data"])
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            counts["malformed"] += 1
+            errors.append((custom_id, f"malformed response: {e}"))
+            continue
+        audio_cache.put("openai", tts.OPENAI_AUDIO_CACHE_VOICE, text, audio_data, ".mp3")
+        counts["synthesized"] += 1
+
+    for note in list(store):
+        updated = dict(note)
+        for field, text in audio_texts(note):
+            file_name = audio_cache.get("openai", tts.OPENAI_AUDIO_CACHE_VOICE, tts.clean_text(text))
+            if file_name:
+                updated[field] = file_name
+        if updated != note:
+            store.upsert(updated)
+            counts["notes updated"] += 1
+
+    store.save()
+    report(counts, errors, results_file)
+
+
+def upload_job(client, job_file):
+    with open(job_file, 'rb') as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=uploaded.id, endpoint=ENDPOINT, completion_window="24h")
+    print(f"Submitted batch {batch.id} for {job_file}")
+
+
+def download_results(client, batch_id, results_file):
+    batch = client.batches.retrieve(batch_id)
+    if batch.status != "completed":
+        print(f"Batch {batch_id} is {batch.status}")
+        return
+    with open(results_file, 'wb') as f:
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                f.write(client.files.content(file_id).read())
+    print(f"Results for batch {batch_id} saved to {results_file}")
+
+
+def openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("submit-translations", "submit-audio"):
+        command = commands.add_parser(name)
+        command.add_argument("job_file")
+        command.add_argument("--upload", action="store_true", help="submit the job to the OpenAI Batch API")
+    for name in ("collect-translations", "collect-audio"):
+        command = commands.add_parser(name)
+        command.add_argument("job_file")
+        command.add_argument("results_file")
+    command = commands.add_parser("download")
+    command.add_argument("batch_id")
+    command.add_argument("results_file")
+    args = parser.parse_args()
+
+    if args.command == "submit-translations":
+        submit_translations(args.job_file)
+    elif args.command == "submit-audio":
+        submit_audio(args.job_file)
+    elif args.command == "collect-translations":
+        collect_translations(args.job_file, args.results_file)
+    elif args.command == "collect-audio":
+        collect_audio(args.job_file, args.results_file)
+    elif args.command == "download":
+        download_results(openai_client(), args.batch_id, args.results_file)
+
+    if getattr(args, "upload", False):
+        upload_job(openai_client(), args.job_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Local stand-in for the OpenAI Batch API.
+
+Reads a job file written by batch_jobs.py and writes a results file in the
+same format the Batch API produces, with placeholder translations and
+audio. Use it to exercise the collect phase without spending credits:
+
+    python batch_stub.py jobs/translations.jsonl jobs/translations.results.jsonl --error-rate 0.05
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+
+
+def fake_translation(body):
+    nepali_word = re.search(r"'(.+?)'", body["messages"][-1]["content"]).group(1)
+    return json.dumps({
+        "english_meaning": f"meaning of {nepali_word}",
+        "nepali_sentence": f"यो <strong>{nepali_word}</strong> हो।",
+        "english_sentence": f"This is {nepali_word}.",
+    }, ensure_ascii=False)
+
+
+def fake_audio(body):
+    # Distinct bytes per text, with an ID3 header so it looks like an mp3.
+    text = body["messages"][-1]["content"]
+    return base64.b64encode(b"ID3" + hashlib.sha256(text.encode('utf-8')).digest()).decode('ascii')
+
+
+def fake_response(body):
+    message = {"role": "assistant", "content": None}
+    if "audio" in body:
+        message["audio"] = {"id": "audio_stub", "data": fake_audio(body), "transcript": ""}
+    else:
+        message["content"] = fake_translation(body)
+    return {"status_code": 200, "request_id": "stub", "body": {"choices": [{"index": 0, "message": message}]}}
+
+
+def run(job_file, results_file, error_rate=0.0, seed=0):
+    rng = random.Random(seed)
+    with open(job_file, 'r', encoding='utf-8') as jobs, open(results_file, 'w', encoding='utf-8') as results:
+        for line in jobs:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            result = {"id": f"batch_req_{request['custom_id']}", "custom_id": request["custom_id"], "response": None, "error": None}
+            if rng.random() < error_rate:
+                result["error"] = {"code": "stub_error", "message": "injected failure"}
+            else:
+                result["response"] = fake_response(request["body"])
+            results.write(json.dumps(result, ensure_ascii=False) + '\n')
+    print(f"Results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a batch job file with placeholder results.")
+    parser.add_argument("job_file")
+    parser.add_argument("results_file")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.job_file, args.results_file, args.error_rate, args.seed)
@@ -0,0 +1,103 @@
+"""Compare genanki's package writer with build_package on processed_notes.json.
+
+The real images and clips live outside the repo, so each note gets
+synthetic media of typical size (random bytes, which like JPEG and MP3 do
+not deflate). Run with: python bench_package.py [--notes N]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import genanki
+
+from incremental_package import build_package, note_guid
+
+# Typical sizes after image_optimize and audio_transcode.
+IMAGE_SIZE = 40 * 1024
+WORD_AUDIO_SIZE = 8 * 1024
+SENTENCE_AUDIO_SIZE = 24 * 1024
+
+FIELDS = ['Index', 'Nepali', 'Romanized', 'English', 'Sentence', 'RomanizedSentence',
+          'EnglishSentence', 'Image', 'WordAudio', 'SentenceAudio']
+
+model = genanki.Model(
+    1607392321,
+    'Benchmark Model',
+    fields=[{'name': name} for name in FIELDS],
+    templates=[{'name': 'Card 1', 'qfmt': '{{Nepali}}', 'afmt': '{{FrontSide}}<hr id="answer">{{English}}'}],
+)
+
+
+def make_media(media_dir, notes):
+    media_files = []
+    for note in notes:
+        for suffix, extension, size in [('img', '.webp', IMAGE_SIZE), ('word', '.mp3', WORD_AUDIO_SIZE), ('sentence', '.mp3', SENTENCE_AUDIO_SIZE)]:
+            path = media_dir / f"{note['index']}_{suffix}{extension}"
+            path.write_bytes(os.urandom(size))
+            media_files.append(str(path))
+    return media_files
+
+
+def make_deck(notes):
+    deck = genanki.Deck(2059400199, 'Benchmark')
+    for note in notes:
+        fields = [
+            str(note["index"]), note["nepali"], note["romanized"], note["english"],
+            note["sentence"], note["romanized_sentence"], note["english_sentence"],
+            f"{note['index']}_img.webp",
+            f"[sound:{note['index']}_word.mp3]",
+            f"[sound:{note['index']}_sentence.mp3]",
+        ]
+        deck.add_note(genanki.Note(model=model, fields=fields, guid=note_guid(note["nepali"])))
+    return deck
+
+
+def timed(label, output_file, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(output_file) / 1024 / 1024
+    print(f"{label:<28} {elapsed:8.3f} s {size:9.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--notes', type=int, default=None, help="limit the number of notes")
+    args = parser.parse_args()
+    # Some corpus sentences contain stray <...> that genanki warns about on every write.
+    warnings.filterwarnings('ignore', module='genanki')
+
+    with open('processed_notes.json', 'r', encoding='utf-8') as f:
+        notes = json.load(f)
+    # The corpus can hold the same word twice; a deck needs one note per word.
+    notes = list({note["nepali"]: note for note in notes}.values())[:args.notes]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        media_dir = tmp / 'media'
+        media_dir.mkdir()
+        media_files = make_media(media_dir, notes)
+        print(f"{len(notes)} notes, {len(media_files)} media files")
+
+        def genanki_write():
+            package = genanki.Package(make_deck(notes))
+            package.media_files = media_files
+            package.write_to_file(tmp / 'genanki.apkg')
+
+        cache_dir = tmp / 'cache'
+        timed("genanki write_to_file", tmp / 'genanki.apkg', genanki_write)
+        timed("build_package (cold)", tmp / 'built.apkg',
+              lambda: build_package(make_deck(notes), media_files, tmp / 'built.apkg', cache_dir=cache_dir))
+        notes[0] = dict(notes[0], english=notes[0]["english"] + " (edited)")
+        timed("build_package (one edit)", tmp / 'built.apkg',
+              lambda: build_package(make_deck(notes), media_files, tmp / 'built.apkg', cache_dir=cache_dir))
+        timed("build_package (no change)", tmp / 'built.apkg',
+              lambda: build_package(make_deck(notes), media_files, tmp / 'built.apkg', cache_dir=cache_dir))
+
+
+if __name__ == "__main__":
+    main()
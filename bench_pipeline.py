@@ -0,0 +1,373 @@
+"""Offline end-to-end benchmark of the card generation pipeline.
+
+Runs the gen_cards.py flow over the word list with every provider swapped
+for a local fake, so throughput can be measured and compared without
+spending credits:
+
+- OpenAI translations and audio: openai_stub.FakeOpenAI
+- Pixabay search and image CDN, Narakeet: a stub HTTP server on localhost
+- Google Translate: translate_stub.FakeTranslateClient
+- ElevenLabs: elevenlabs_stub.FakeElevenLabs, timed on a Q&A deck built
+  from the generated notes as quick.py builds its decks
+
+Latency, error rate and payload size are configurable per provider. Rate
+limits are lifted unless --keep-rate-limits is given, so the numbers
+reflect the pipeline rather than the throttle. Everything runs in a
+temporary directory; the real caches and notes are never touched.
+
+    python bench_pipeline.py --words 200 --openai-latency 0.8 --error-rate 0.02 --warm
+
+Reports words/sec, p50/p99 per-word latency (from the start of the word's
+batch until its translation and media are ready), package build time,
+peak RSS and the per-stage metrics, and writes them to --output as JSON.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlparse
+
+REPO_DIR = Path(__file__).resolve().parent
+WORDS_FILE = REPO_DIR / '1000-most-common-nepali-words.txt'
+TRANSLATIONS_FILE = REPO_DIR / '1000-most-common-nepali-words-translated.txt'
+PROVIDERS = ["openai", "pixabay", "pixabay_cdn", "narakeet", "elevenlabs", "google"]
+
+
+def base_image():
+    """A small valid JPEG, so image optimization has real work to do."""
+    try:
+        from io import BytesIO
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0"
+    image = Image.linear_gradient("L").resize((640, 427)).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def base_audio():
+    """One second of tone as mp3 if ffmpeg is available."""
+    if shutil.which("ffmpeg") is None:
+        return b"ID3"
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=1",
+               "-ac", "1", "-b:a", "64k", "-f", "mp3", "-"]
+    return subprocess.run(command, check=True, capture_output=True).stdout
+
+
+def payload(base, key, size):
+    """base followed by bytes unique to key, padded to size.
+
+    Decoders stop at the end of the real data, and the unique tail keeps
+    the content-addressed caches from collapsing every response into one file.
+    """
+    tail = hashlib.sha256(key.encode('utf-8')).digest()
+    padding = max(0, size - len(base) - len(tail))
+    return base + tail + random.Random(tail).randbytes(padding)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Pixabay search, Pixabay CDN and Narakeet, with injected latency and failures."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, latency, content_type, body):
+        config = self.server.config
+        time.sleep(latency)
+        with config["lock"]:
+            fail = config["rng"].random() < config["error_rate"]
+        if fail:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        config = self.server.config
+        url = urlparse(self.path)
+        if url.path == "/api/":
+            query = parse_qs(url.query).get("q", [""])[0]
+            image_url = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}/cdn/{quote(query)}.jpg"
+            body = json.dumps({"hits": [{"largeImageURL": image_url}]}).encode('utf-8')
+            self.respond(config["pixabay_latency"], "application/json", body)
+        elif url.path.startswith("/cdn/"):
+            body = payload(config["image"], url.path, config["image_size"])
+            self.respond(config["cdn_latency"], "image/jpeg", body)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        config = self.server.config
+        text = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlparse(self.path).path == "/text-to-speech/m4a":
+            body = payload(config["audio"], text.decode('utf-8'), config["audio_size"])
+            self.respond(config["tts_latency"], "application/octet-stream", body)
+        else:
+            self.send_error(404)
+
+
+def start_stub_server(config):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_generation(gen_cards, nepali_words, batch_size, store):
+    """Run generate_notes over nepali_words and return (seconds, per-word latencies, failed words).
+
+    A word's latency runs from the start of its batch until its last media
+    fetch is done; words whose translation failed are not counted.
+    """
+    latencies = []
+    batch_start = threading.local()
+    generate_batch = gen_cards.generate_batch
+    submit_media = gen_cards.submit_media
+
+    def timed_batch(batch):
+        batch_start.value = time.perf_counter()
+        return generate_batch(batch)
+
+    def timed_media(nepali_word, parsed):
+        futures = submit_media(nepali_word, parsed)
+        start = batch_start.value
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def done(future):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    latencies.append(time.perf_counter() - start)
+
+        for future in futures:
+            future.add_done_callback(done)
+        return futures
+
+    gen_cards.generate_batch = timed_batch
+    gen_cards.submit_media = timed_media
+    try:
+        start = time.perf_counter()
+        failed = gen_cards.generate_notes(iter(nepali_words), batch_size, store)
+        return time.perf_counter() - start, latencies, failed
+    finally:
+        gen_cards.generate_batch = generate_batch
+        gen_cards.submit_media = submit_media
+
+
+def run_qa_deck(quick, notes, output_file, audio_dir):
+    """Build a Q&A deck over notes as quick.py does; return (seconds, entries)."""
+    from incremental_package import DeckBuild
+
+    data = [
+        {
+            "question_nep": f"{note['nepali']} भनेको के हो?",
+            "question_eng": f"What is {note['english']}?",
+            "answer_nep": note["sentence"],
+            "answer_eng": note["english_sentence"],
+        }
+        for note in notes
+    ]
+    audio_dirs = {"question": audio_dir / "questions", "answer": audio_dir / "answers"}
+    start = time.perf_counter()
+    build = DeckBuild()
+    quick.create_deck(build, 2059400200, "Bench Q&A", quick.make_model(), data, audio_dirs)
+    build.write_package(output_file)
+    return time.perf_counter() - start, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the card pipeline against local fake providers.")
+    parser.add_argument("--words", type=int, default=None, help="number of words (default: the whole list)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--openai-latency", type=float, default=0.8, help="seconds per OpenAI request")
+    parser.add_argument("--openai-latency-per-item", type=float, default=0.1, help="extra seconds per word in a batch")
+    parser.add_argument("--pixabay-latency", type=float, default=0.15)
+    parser.add_argument("--cdn-latency", type=float, default=0.05)
+    parser.add_argument("--tts-latency", type=float, default=0.6, help="seconds per Narakeet request")
+    parser.add_argument("--elevenlabs-latency", type=float, default=0.7, help="seconds per ElevenLabs request")
+    parser.add_argument("--google-latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail with 503")
+    parser.add_argument("--image-size", type=int, default=120 * 1024)
+    parser.add_argument("--audio-size", type=int, default=24 * 1024)
+    parser.add_argument("--skip-media-processing", action="store_true", help="package without optimizing or transcoding")
+    parser.add_argument("--warm", action="store_true", help="run generation a second time against the warm caches")
+    parser.add_argument("--keep-rate-limits", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    output_file = Path(args.output).resolve()
+
+    sys.path.insert(0, str(REPO_DIR))
+    from word_lists import read_words
+    words = list(islice(read_words(WORDS_FILE, TRANSLATIONS_FILE, on_error=lambda *a: None), args.words))
+    nepali_words = [nepali_word for nepali_word, _ in words]
+
+    tmp = Path(tempfile.mkdtemp(prefix="anki-bench-"))
+    os.chdir(tmp)
+    server = start_stub_server({
+        "lock": threading.Lock(),
+        "rng": random.Random(args.seed),
+        "error_rate": args.error_rate,
+        "pixabay_latency": args.pixabay_latency,
+        "cdn_latency": args.cdn_latency,
+        "tts_latency": args.tts_latency,
+        "image": base_image(),
+        "audio": base_audio(),
+        "image_size": args.image_size,
+        "audio_size": args.audio_size,
+    })
+    stub_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # Configuration is read at import time, so set it before importing.
+    os.environ.update({
+        "OPENAI_API_KEY": "bench", "PIXABAY_API_KEY": "bench", "NARAKEET_API_KEY": "bench",
+        "PIXABAY_API_URL": f"{stub_url}/api/",
+        "NARAKEET_API_URL": stub_url,
+        "GEN_CONCURRENCY": str(args.concurrency),
+        # Let the TTS providers keep up with the two audio clips per word.
+        "TTS_CONCURRENCY_OPENAI": str(args.concurrency * 2),
+        "TTS_CONCURRENCY_NARAKEET": str(args.concurrency * 2),
+        "TTS_CONCURRENCY_ELEVENLABS": str(args.concurrency * 2),
+        "GEN_BATCH_SIZE": str(args.batch_size),
+        "RESPONSE_CACHE_FILE": str(tmp / "llm_cache.sqlite3"),
+        "METRICS_FILE": str(tmp / "metrics.json"),
+    })
+    if not args.keep_rate_limits:
+        for provider in PROVIDERS:
+            os.environ[f"RATE_LIMIT_{provider.upper()}"] = "100000:100000"
+
+    import metrics
+    from clients import set_client
+    from note_store import open_store
+    from elevenlabs_stub import FakeElevenLabs
+    from openai_stub import FakeOpenAI
+    from translate_stub import FakeTranslateClient
+    import translate_words
+    import gen_cards
+
+    results = {"config": vars(args), "words": len(nepali_words)}
+    print(f"Benchmarking {len(nepali_words)} words in {tmp}")
+
+    # Google Translate of the same words.
+    (tmp / "words.txt").write_text('\n'.join(nepali_words) + '\n', encoding='utf-8')
+    start = time.perf_counter()
+    translate_words.translate_words(tmp / "words.txt", tmp / "translated.txt", FakeTranslateClient(latency=args.google_latency, error_rate=args.error_rate, seed=args.seed))
+    results["google_translate_seconds"] = time.perf_counter() - start
+
+    # Translation, sentence, image and audio generation, as in gen_cards.py.
+    set_client("openai", FakeOpenAI(args.openai_latency, args.openai_latency_per_item, args.error_rate, base_audio(), args.audio_size, args.seed))
+    gen_cards.image_dir = tmp / "images"
+    gen_cards.audio_dir = tmp / "audio"
+    store = open_store(tmp / "processed_notes.json")
+    seconds, latencies, failed = run_generation(gen_cards, nepali_words, args.batch_size, store)
+    store.save()
+    results["generate"] = {
+        "seconds": seconds,
+        "words_per_second": (len(nepali_words) - len(failed)) / seconds if seconds else None,
+        "p50_word_latency": percentile(latencies, 0.50),
+        "p99_word_latency": percentile(latencies, 0.99),
+        "failed_words": len(failed),
+    }
+
+    if args.warm:
+        # Same words against the warm response and media caches.
+        store = open_store(tmp / "warm_notes.json")
+        seconds, latencies, failed = run_generation(gen_cards, nepali_words, args.batch_size, store)
+        results["generate_warm"] = {
+            "seconds": seconds,
+            "words_per_second": (len(nepali_words) - len(failed)) / seconds if seconds else None,
+            "p50_word_latency": percentile(latencies, 0.50),
+            "p99_word_latency": percentile(latencies, 0.99),
+            "failed_words": len(failed),
+        }
+
+    # Narakeet audio for every stored word and sentence, as in gen_cards_new_audio.py.
+    import gen_cards_new_audio
+    import tts
+    texts = [text for note in store.notes for text in (note["nepali"], note["sentence"])]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency * 2) as executor:
+        list(executor.map(lambda text: tts.speak(gen_cards_new_audio.VOICE, text, tmp / "narakeet"), texts))
+    results["narakeet_seconds"] = time.perf_counter() - start
+
+    if args.skip_media_processing:
+        gen_cards.optimize_images = lambda image_dir, names: {name: Path(image_dir) / name for name in names if name}
+        gen_cards.transcode_audio = lambda audio_dir, names: {name: Path(audio_dir) / name for name in names if name}
+    start = time.perf_counter()
+    gen_cards.write_deck(store.notes, tmp / "bench.apkg")
+    results["package_seconds"] = time.perf_counter() - start
+    results["package_mb"] = os.path.getsize(tmp / "bench.apkg") / 1024 / 1024
+
+    # ElevenLabs audio for a Q&A deck over the stored notes, as in quick.py.
+    import quick
+    set_client("elevenlabs", FakeElevenLabs(args.elevenlabs_latency, args.error_rate, base_audio(), args.audio_size, args.seed))
+    if args.skip_media_processing:
+        quick.transcode_audio = gen_cards.transcode_audio
+    seconds, entries = run_qa_deck(quick, store.notes, tmp / "qa.apkg", tmp / "elevenlabs")
+    results["qa"] = {"seconds": seconds, "entries": entries, "entries_per_second": entries / seconds if seconds else None}
+    results["peak_rss_mb"] = peak_rss_mb()
+    results["metrics"] = metrics.snapshot()
+
+    server.shutdown()
+    generate = results["generate"]
+    print(f"\n{'words':<28} {len(nepali_words)}")
+    print(f"{'words/sec':<28} {generate['words_per_second']:.2f}")
+    print(f"{'p50 / p99 word latency':<28} {generate['p50_word_latency']:.2f}s / {generate['p99_word_latency']:.2f}s")
+    if args.warm:
+        print(f"{'words/sec (warm caches)':<28} {results['generate_warm']['words_per_second']:.2f}")
+    print(f"{'failed words':<28} {generate['failed_words']}")
+    print(f"{'google translate':<28} {results['google_translate_seconds']:.2f}s")
+    print(f"{'narakeet audio':<28} {results['narakeet_seconds']:.2f}s")
+    print(f"{'elevenlabs Q&A deck':<28} {results['qa']['seconds']:.2f}s ({results['qa']['entries']} entries)")
+    print(f"{'package build':<28} {results['package_seconds']:.2f}s ({results['package_mb']:.1f} MB)")
+    if results["peak_rss_mb"] is not None:
+        print(f"{'peak RSS':<28} {results['peak_rss_mb']:.0f} MB")
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output_file}")
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
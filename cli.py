@@ -0,0 +1,277 @@
+"""Single entry point for the deck scripts.
+
+    python cli.py generate [--batch-size N] [--dry-run] [--no-package]
+    python cli.py regenerate [--outdated] [--dry-run] [--no-package]
+    python cli.py reaudio
+    python cli.py qa [--deck quick|more|all]
+    python cli.py alphabet [--single-package]
+    python cli.py translate [--input FILE] [--output FILE] [--fake]
+    python cli.py build [--output FILE]
+    python cli.py romanize [--scheme learner|iast|iso] [--check] [TEXT]
+    python cli.py verify [--repair] [--scan-audio DIR] [--scan-images DIR]
+    python cli.py worker [--concurrency N] [--exit-when-idle]
+    python cli.py submit words|qa|alphabet --output FILE [--owner NAME] ...
+    python cli.py jobs [--status STATUS]
+
+Any command takes ``--tts openai|narakeet|elevenlabs|local`` before its
+name to swap the voice, e.g. ``python cli.py --tts local alphabet``, and
+``--pair-audio`` to speak both texts of a note in one request.
+
+Each command imports its module only when it runs, and the modules load
+their SDKs (openai, elevenlabs, google.cloud, genanki) on first use, so
+`--help` and `--dry-run` start without importing any of them. The same
+functions can be called directly by anything that imports the modules.
+"""
+import argparse
+import sys
+
+from dotenv import load_dotenv
+
+import metrics
+
+
+def cmd_generate(args):
+    import gen_cards
+    if args.dry_run:
+        pending = list(gen_cards.pending_words())
+        for nepali_word in pending[:args.show]:
+            print(nepali_word)
+        print(f"{len(pending)} words pending")
+        return False
+    gen_cards.generate(args.batch_size or gen_cards.BATCH_SIZE, args.output, package=not args.no_package)
+    return True
+
+
+def cmd_regenerate(args):
+    import gen_cards
+    gen_cards.regenerate(args.batch_size or gen_cards.BATCH_SIZE, args.outdated, args.output, package=not args.no_package, dry_run=args.dry_run)
+    return not args.dry_run
+
+
+def cmd_reaudio(args):
+    import gen_cards_new_audio
+    gen_cards_new_audio.reaudio(args.output)
+    return True
+
+
+def cmd_qa(args):
+    if args.deck in ("quick", "all"):
+        import quick
+        quick.generate_qa()
+    if args.deck in ("more", "all"):
+        import more
+        more.generate_sentences()
+    return True
+
+
+def cmd_alphabet(args):
+    import gen_vowel_consonant_notes
+    gen_vowel_consonant_notes.generate_alphabet(args.single_package or gen_vowel_consonant_notes.SINGLE_PACKAGE)
+    return True
+
+
+def cmd_translate(args):
+    import translate_words
+    client = None
+    if args.fake:
+        from translate_stub import FakeTranslateClient
+        client = FakeTranslateClient(latency=0.05, error_rate=args.fake_error_rate)
+    translate_words.translate_words(args.input, args.output, client)
+    return True
+
+
+def cmd_build(args):
+    import gen_cards
+    from note_store import open_store
+    gen_cards.write_deck(open_store(gen_cards.notes_file).notes, args.output)
+    return True
+
+
+def cmd_romanize(args):
+    import romanize
+    args.scheme = args.scheme or romanize.ROMANIZATION_SCHEME
+    if args.check:
+        failures = romanize.check_examples()
+        for word, expected, got in failures:
+            print(f"{word}: expected {expected}, got {got}")
+        print(f"{len(romanize.EXAMPLES) - len(failures)}/{len(romanize.EXAMPLES)} romanization examples pass")
+        if failures:
+            sys.exit(1)
+        return False
+    if args.text:
+        print(romanize.romanize(args.text, args.scheme))
+        return False
+    import gen_cards
+    from note_store import open_store
+    changed = romanize.romanize_store(open_store(gen_cards.notes_file), args.scheme)
+    print(f"Romanized {changed} notes with the {args.scheme} scheme")
+    return False
+
+
+def cmd_verify(args):
+    from collections import Counter
+    import gen_cards
+    import media_verify
+    from note_store import open_store
+    store = open_store(gen_cards.notes_file)
+    repairs = media_verify.verify_notes(store.notes, gen_cards.image_dir, gen_cards.audio_dir, args.workers)
+    for problem, count in Counter(entry["problem"].split(":")[0] for entry in repairs).most_common():
+        print(f"{count:>6}  {problem}")
+    print(f"{len(repairs)} assets need repair")
+    if args.repair and repairs:
+        repairs = media_verify.repair(store, repairs, gen_cards.image_dir, gen_cards.audio_dir)
+    media_verify.write_repair_queue(repairs)
+
+    # Directories of the other scripts: bad files are deleted, so the next run regenerates them.
+    for kind, directories in (("audio", args.scan_audio), ("image", args.scan_images)):
+        for directory in directories:
+            bad = media_verify.verify_directory(directory, kind, args.workers)
+            for name, problem in sorted(bad.items()):
+                print(f"{directory}/{name}: {problem}")
+                if args.repair:
+                    media_verify.discard(directory, name)
+            print(f"{directory}: {len(bad)} bad files{' deleted' if args.repair and bad else ''}")
+    return True
+
+
+def cmd_worker(args):
+    import worker
+    queue = worker.JobQueue(args.queue or worker.WORKER_QUEUE_FILE)
+    try:
+        worker.Worker(queue, args.concurrency or worker.WORKER_CONCURRENCY).run(args.exit_when_idle)
+    finally:
+        queue.close()
+    return True
+
+
+def cmd_submit(args):
+    import json
+    import worker
+    payload = json.loads(args.payload) if args.payload else {}
+    if args.data:
+        with open(args.data, encoding='utf-8') as file:
+            payload["decks" if args.kind == "alphabet" else "data"] = json.load(file)
+    if args.words:
+        payload["words"] = args.words
+    for key in ("output", "word_file", "translations_file", "notes_file", "deck_id", "deck_name"):
+        if getattr(args, key) is not None:
+            payload[key] = getattr(args, key)
+    job_id = worker.submit(args.kind, payload, args.owner, args.queue or worker.WORKER_QUEUE_FILE)
+    print(f"Queued job {job_id}")
+    return False
+
+
+def cmd_jobs(args):
+    import worker
+    queue = worker.JobQueue(args.queue or worker.WORKER_QUEUE_FILE)
+    try:
+        for job in queue.jobs(args.status):
+            print(f"{job['id']:>6} {job['kind']:<9} {job['owner']:<16} {job['status']:<7} {job['attempts']:>2} {job['error'] or job['result'] or ''}")
+    finally:
+        queue.close()
+    return False
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate Nepali Anki decks.")
+    parser.add_argument("--tts", choices=["openai", "narakeet", "elevenlabs", "local"], default=None,
+                        help="speak everything with this provider's default voice, e.g. local for offline drafts (default: TTS_PROVIDER)")
+    parser.add_argument("--pair-audio", action="store_true",
+                        help="speak both texts of a note in one request and split the clip at the pause (default: TTS_PAIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="generate notes for the word list and package the deck")
+    generate.add_argument("--batch-size", type=int, default=None, help="words per request (default: GEN_BATCH_SIZE)")
+    generate.add_argument("--output", default="Nepali-1K.apkg")
+    generate.add_argument("--dry-run", action="store_true", help="list the words that still need notes and exit")
+    generate.add_argument("--show", type=int, default=20, help="pending words to print with --dry-run")
+    generate.add_argument("--no-package", action="store_true", help="generate notes without writing the deck")
+    generate.set_defaults(handler=cmd_generate)
+
+    regenerate = commands.add_parser("regenerate", help="redo only the failed, partial or outdated notes, keeping their index")
+    regenerate.add_argument("--outdated", action="store_true", help="also redo notes made by another model or prompt")
+    regenerate.add_argument("--batch-size", type=int, default=None, help="words per request (default: GEN_BATCH_SIZE)")
+    regenerate.add_argument("--output", default="Nepali-1K.apkg")
+    regenerate.add_argument("--dry-run", action="store_true", help="list the notes that would be redone and exit")
+    regenerate.add_argument("--no-package", action="store_true", help="fix the notes without writing the deck")
+    regenerate.set_defaults(handler=cmd_regenerate)
+
+    reaudio = commands.add_parser("reaudio", help="rebuild the deck from stored notes with Narakeet audio")
+    reaudio.add_argument("--output", default="Nepali-1000.apkg")
+    reaudio.set_defaults(handler=cmd_reaudio)
+
+    qa = commands.add_parser("qa", help="build the question and answer decks with ElevenLabs audio")
+    qa.add_argument("--deck", choices=["quick", "more", "all"], default="all")
+    qa.set_defaults(handler=cmd_qa)
+
+    alphabet = commands.add_parser("alphabet", help="build the vowel, consonant and diacritic decks")
+    alphabet.add_argument("--single-package", action="store_true", help="write all three decks to one .apkg (default: SINGLE_PACKAGE)")
+    alphabet.set_defaults(handler=cmd_alphabet)
+
+    translate = commands.add_parser("translate", help="translate the word list with Google Translate")
+    translate.add_argument("--input", default="1000-most-common-nepali-words.txt")
+    translate.add_argument("--output", default="1000-most-common-nepali-words-translated.txt")
+    translate.add_argument("--fake", action="store_true", help="use the local fake client from translate_stub.py")
+    translate.add_argument("--fake-error-rate", type=float, default=0.0)
+    translate.set_defaults(handler=cmd_translate)
+
+    build = commands.add_parser("build", help="package the stored notes without calling any API")
+    build.add_argument("--output", default="Nepali-1K.apkg")
+    build.set_defaults(handler=cmd_build)
+
+    romanize = commands.add_parser("romanize", help="romanize TEXT, or re-romanize every stored note")
+    romanize.add_argument("text", nargs="?", help="Devanagari text to romanize instead of the notes")
+    romanize.add_argument("--scheme", choices=["learner", "iast", "iso"], default=None, help="(default: ROMANIZATION_SCHEME)")
+    romanize.add_argument("--check", action="store_true", help="check the learner scheme against romanize.EXAMPLES")
+    romanize.set_defaults(handler=cmd_romanize)
+
+    verify = commands.add_parser("verify", help="check the media behind the notes and regenerate what is broken")
+    verify.add_argument("--repair", action="store_true", help="regenerate the bad or missing assets")
+    verify.add_argument("--workers", type=int, default=None, help="files checked at a time (default: one per CPU)")
+    verify.add_argument("--scan-audio", action="append", default=[], metavar="DIR", help="also check every clip in DIR")
+    verify.add_argument("--scan-images", action="append", default=[], metavar="DIR", help="also check every image in DIR")
+    verify.set_defaults(handler=cmd_verify)
+
+    worker = commands.add_parser("worker", help="process queued jobs, keeping clients and caches warm between them")
+    worker.add_argument("--queue", default=None, help="queue database (default: WORKER_QUEUE_FILE)")
+    worker.add_argument("--concurrency", type=int, default=None, help="jobs run at a time (default: WORKER_CONCURRENCY)")
+    worker.add_argument("--exit-when-idle", action="store_true", help="stop once the queue is empty")
+    worker.set_defaults(handler=cmd_worker)
+
+    submit = commands.add_parser("submit", help="queue a job for the worker")
+    submit.add_argument("kind", choices=["words", "qa", "alphabet"])
+    submit.add_argument("--output", required=True)
+    submit.add_argument("--owner", default="default", help="learner or language the job is for; jobs are shared fairly between owners")
+    submit.add_argument("--queue", default=None, help="queue database (default: WORKER_QUEUE_FILE)")
+    submit.add_argument("--words", nargs="+", help="words for a words job")
+    submit.add_argument("--word-file", help="word list for a words job")
+    submit.add_argument("--translations-file")
+    submit.add_argument("--notes-file")
+    submit.add_argument("--data", help="JSON file with the Q&A entries, or the alphabet decks")
+    submit.add_argument("--deck-id", type=int)
+    submit.add_argument("--deck-name")
+    submit.add_argument("--payload", help="extra payload fields as a JSON object")
+    submit.set_defaults(handler=cmd_submit)
+
+    jobs = commands.add_parser("jobs", help="list queued and finished jobs")
+    jobs.add_argument("--queue", default=None, help="queue database (default: WORKER_QUEUE_FILE)")
+    jobs.add_argument("--status", choices=["queued", "running", "done", "failed"])
+    jobs.set_defaults(handler=cmd_jobs)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    load_dotenv()
+    if args.tts:
+        import tts
+        tts.TTS_PROVIDER = args.tts
+    if args.pair_audio:
+        import tts
+        tts.TTS_PAIR = True
+    if args.handler(args):
+        metrics.report()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Shared API clients, created on first use.
+
+Each SDK is imported only when its client is first requested, so commands
+that never talk to a provider start without loading openai, elevenlabs or
+google.cloud. Clients are created once per process and shared by all
+threads. set_client installs a replacement, e.g. a fake for benchmarks or
+a client configured by a long-running worker.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+
+# Credentials file used by translate_words.py when none is configured.
+GOOGLE_CREDENTIALS_FILE = r"C:\Users\rvand\Downloads\anki-translation-442303-7b1c82eb3428.json"
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def make_openai():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)  # retries go through rate_limit
+
+
+def make_elevenlabs():
+    from elevenlabs import ElevenLabs
+    return ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+
+
+def make_google_translate():
+    os.environ.setdefault('GOOGLE_APPLICATION_CREDENTIALS', GOOGLE_CREDENTIALS_FILE)
+    from google.cloud import translate_v2 as translate
+    return translate.Client()
+
+
+FACTORIES = {
+    "openai": make_openai,
+    "elevenlabs": make_elevenlabs,
+    "google": make_google_translate,
+}
+
+
+def get_client(name):
+    """Return the shared client for a provider, creating it on first use."""
+    with _clients_lock:
+        if name not in _clients:
+            load_dotenv()
+            _clients[name] = FACTORIES[name]()
+        return _clients[name]
+
+
+def set_client(name, client):
+    with _clients_lock:
+        _clients[name] = client
@@ -0,0 +1,47 @@
+"""Local stand-in for the ElevenLabs client used by quick.py and more.py.
+
+FakeElevenLabs answers text_to_speech.convert like the real client, with
+audio streamed back in chunks after a configurable delay. It can inject
+retryable failures partway through the stream, so the Q&A decks can be
+built and benchmarked offline.
+"""
+import hashlib
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from rate_limit import RetryableError
+
+CHUNK_SIZE = 4096
+
+
+class FakeElevenLabs:
+    def __init__(self, latency=0.5, error_rate=0.0, audio_payload=b"ID3", audio_size=0, seed=0):
+        """Audio is audio_payload plus bytes unique to the text and voice, padded to audio_size."""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.audio_payload = audio_payload
+        self.audio_size = audio_size
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.text_to_speech = SimpleNamespace(convert=self.convert)
+
+    def convert(self, voice_id, text, model_id=None, output_format=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.error_rate
+        # Distinct bytes per text, so the media cache does not collapse them.
+        tail = hashlib.sha256(f"{voice_id}\0{text}".encode('utf-8')).digest()
+        padding = max(0, self.audio_size - len(self.audio_payload) - len(tail))
+        audio = self.audio_payload + tail + random.Random(tail).randbytes(padding)
+
+        def stream():
+            time.sleep(self.latency)
+            for start in range(0, len(audio), CHUNK_SIZE):
+                yield audio[start:start + CHUNK_SIZE]
+                if fail:
+                    raise RetryableError("injected failure", status_code=503)
+
+        return stream()
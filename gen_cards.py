@@ -1,224 +1,200 @@
-import genanki
-import requests
 from pathlib import Path
 from dotenv import load_dotenv
 import os
-from openai import OpenAI
-from pydantic import BaseModel
 from itertools import islice
-import re
-import re
-import base64
-import json
-
-load_dotenv()
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-PIXABAY_API_KEY = os.getenv("PIXABAY_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
-
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import time
+from clients import get_client
+from note_store import open_store
+from word_lists import read_words
+from translation import TRANSLATION_VERSION, translate_word, translate_batch
+from romanize import romanize
+import images
+import metrics
+import tts
+from image_optimize import optimize_images
+from audio_transcode import transcode_audio
+
+# Importing this module has no side effects: the OpenAI client, the note
+# store and genanki are only loaded when they are first needed.
+
+# Number of words generated at the same time. Each word in flight fans out
+# into up to three media fetches, so the media pool is sized accordingly.
+# The pool's threads start on first use and stay idle between runs.
+CONCURRENCY = int(os.getenv("GEN_CONCURRENCY", "8"))
+media_executor = ThreadPoolExecutor(max_workers=CONCURRENCY * 3)
+
+# Created on first use by the media caches.
 image_dir = Path(r"C:\anki_images")
 audio_dir = Path(r"C:\anki_audio")
-image_dir.mkdir(exist_ok=True)
-audio_dir.mkdir(exist_ok=True)
 
 notes_file = Path(r"processed_notes.json")
-if not notes_file.exists():
-    notes_file.write_text("[]")  
-
-def load_translations():
-    with open('1000-most-common-nepali-words.txt', 'r', encoding='utf-8') as nepali_file, \
-         open('1000-most-common-nepali-words-translated.txt', 'r', encoding='utf-8') as english_file:
-        nepali_words = [line.strip() for line in nepali_file.readlines()]
-        english_words = [line.strip() for line in english_file.readlines()]
 
-    if len(nepali_words) != len(english_words):
-        raise ValueError("Mismatch between the number of Nepali and English words.")
+# A plain word list (with an optional line-aligned translation file) or a
+# .tsv/.csv of word and translation. Read lazily; see word_lists.py.
+WORDS_FILE = os.getenv("GEN_WORDS_FILE", '1000-most-common-nepali-words.txt')
+TRANSLATIONS_FILE = os.getenv("GEN_TRANSLATIONS_FILE", '1000-most-common-nepali-words-translated.txt') or None
 
-    return dict(zip(nepali_words, english_words))
-
-translations = load_translations()
+def load_translations():
+    """Yield (nepali, english) pairs from the word list as it is read."""
+    return read_words(WORDS_FILE, TRANSLATIONS_FILE)
 
 def fetch_image(english_word):
-    try:
-        if not english_word:
-            print(f"No English translation available.")
-            return None
-
-        image_file_name = f"{english_word.replace(' ', '_')}.jpg"
-        image_path = image_dir / image_file_name
-
-        if image_path.exists():
-            return image_file_name 
-
-        url = f"https://pixabay.com/api/?key={PIXABAY_API_KEY}&q={english_word}&image_type=photo&per_page=3"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-
-        if data['hits']:
-            img_data = requests.get(data['hits'][0]['largeImageURL']).content
-            with open(image_path, 'wb') as handler:
-                handler.write(img_data)
-            return image_file_name
-        else:
-            return None
-    except Exception as e:
-        print(f"Error fetching image for '{english_word}': {e}")
-        return None
+    return images.fetch_image(english_word, image_dir)
 
-def fetch_audio(text, file_name):
-    try:
-        audio_file_path = audio_dir / file_name
-
-        if audio_file_path.exists():
-            return file_name
-
-        cleaned_text = re.sub(r'<.*?>', '', text)
-
-        completion = client.chat.completions.create(
-            model="gpt-4o-audio-preview",
-            modalities=["text", "audio"],
-            audio={"voice": "alloy", "format": "mp3"},
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an expert Nepali speaker. Your task is to pronounce exactly and clearly the text provided, "
-                        "without adding or modifying anything. Do not include greetings, explanations, or additional sounds."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": f"{cleaned_text}"
-                },
-            ]
-        )
+# TTS_PROVIDER (e.g. local for offline drafts) swaps in another provider.
+VOICE = tts.OpenAIVoice()
 
-        mp3_bytes = base64.b64decode(completion.choices[0].message.audio.data)
-        with open(audio_file_path, "wb") as f:
-            f.write(mp3_bytes)
-
-        return file_name
-    except Exception as e:
-        print(f"Error generating audio for '{text}': {e}")
-        return None
+def fetch_audio(text):
+    return tts.speak(tts.voice_for(VOICE), text, audio_dir)
 
-class TranslationResponse(BaseModel):
-    english_meaning: str
-    romanized_word: str
-    nepali_sentence: str
-    romanized_sentence: str
-    english_sentence: str
+def fetch_audio_pair(nepali_word, nepali_sentence):
+    return tts.speak_pair(tts.voice_for(VOICE), nepali_word, nepali_sentence, audio_dir)
 
-def generate_translation_sentence_image_audio(nepali_word):
-    """Generate translations, sentences, image, and audio for a Nepali word."""
-    try:
-        response = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a language expert. Extract structured information about the Nepali word provided."
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        f"For the Nepali word '{nepali_word}', provide:\n"
-                        "1. Its meaning in English.\n"
-                        "2. The romanized version of the Nepali word.\n"
-                        "3. A simple sample sentence in Nepali where the word is used, "
-                        "with the word <strong></strong>.\n"
-                        "4. The same sentence romanized, also with the word <strong></strong>.\n"
-                        "5. Translate the Nepali sentence into English, preserving the meaning."
-                    )
-                },
-            ],
-            response_format=TranslationResponse
-        )
-        parsed = response.choices[0].message.parsed
+# Words translated per request. Larger batches mean fewer round trips but
+# longer responses, so keep BATCH_SIZE * ~150 tokens under the output limit.
+BATCH_SIZE = int(os.getenv("GEN_BATCH_SIZE", "10"))
 
-        image_path = fetch_image(parsed.english_meaning)
+# Seconds to wait before retrying the words that failed during the main pass.
+RETRY_QUEUE_DELAY = int(os.getenv("GEN_RETRY_QUEUE_DELAY", "60"))
 
-        word_audio = fetch_audio(nepali_word, f"{nepali_word}_word.mp3")
+FAILED_RESULT = ("N/A", "N/A", "N/A", "N/A", "N/A", None, None, None)
 
-        sentence_audio = fetch_audio(parsed.nepali_sentence, f"{nepali_word}_sentence.mp3")
+def submit_media(nepali_word, parsed):
+    # The image and both audio clips only depend on the translation, so
+    # fetch them side by side instead of one after the other. With TTS_PAIR
+    # both clips come from one synthesis.
+    image_future = media_executor.submit(fetch_image, parsed.english_meaning)
+    if tts.can_pair(tts.voice_for(VOICE)):
+        return image_future, media_executor.submit(fetch_audio_pair, nepali_word, parsed.nepali_sentence)
+    return (
+        image_future,
+        media_executor.submit(fetch_audio, nepali_word),
+        media_executor.submit(fetch_audio, parsed.nepali_sentence),
+    )
 
+def collect_result(nepali_word, parsed, media_futures):
+    try:
+        image_future, *audio_futures = media_futures
+        if len(audio_futures) == 1:
+            word_audio, sentence_audio = audio_futures[0].result()
+        else:
+            word_audio, sentence_audio = (future.result() for future in audio_futures)
         return (
             parsed.english_meaning,
-            parsed.romanized_word,
+            romanize(nepali_word),
             parsed.nepali_sentence,
-            parsed.romanized_sentence,
+            romanize(parsed.nepali_sentence, sentence=True),
             parsed.english_sentence,
-            image_path,
+            image_future.result(),
             word_audio,
             sentence_audio,
         )
     except Exception as e:
         print(f"Error generating for {nepali_word}: {e}")
-        return "N/A", "N/A", "N/A", "N/A", "N/A", None, None, None
-
-def load_existing_notes():
-    if notes_file.exists():
-        with open(notes_file, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    return []
-
-def save_notes(notes):
-    with open(notes_file, 'w', encoding='utf-8') as file:
-        json.dump(notes, file, ensure_ascii=False, indent=4)
-
-def note_exists(existing_notes, nepali_word):
-    return any(note['nepali'] == nepali_word for note in existing_notes)
-
-existing_notes = load_existing_notes()
-notes = existing_notes.copy()
-
-index = len(existing_notes) + 1
-
-for nepali_word in translations.keys(): 
-    if note_exists(existing_notes, nepali_word):
-        continue 
-
-    english_word = translations[nepali_word]
-    english, romanized_word, nepali_sentence, romanized_sentence, english_sentence, image_file_name, word_audio, sentence_audio = generate_translation_sentence_image_audio(nepali_word)
-
-    new_note = {
-        "index": index,
-        "nepali": nepali_word,
-        "romanized": romanized_word,
-        "english": english,
-        "sentence": nepali_sentence,
-        "romanized_sentence": romanized_sentence,
-        "english_sentence": english_sentence,
-        "image": image_file_name or '',
-        "word_audio": word_audio or '',
-        "sentence_audio": sentence_audio or ''
-    }
-    notes.append(new_note)
-    index += 1
-
-save_notes(notes)
-
-model = genanki.Model(
-    1607392319,
-    'Nepali Words Model',
-    fields=[
-        {'name': 'Index'},
-        {'name': 'Nepali'},
-        {'name': 'Romanized'},
-        {'name': 'English'},
-        {'name': 'Sentence'},
-        {'name': 'Romanized Sentence'},
-        {'name': 'English Sentence'},
-        {'name': 'Image'},
-        {'name': 'Word Audio'},
-        {'name': 'Sentence Audio'}
-    ],
-    templates=[
-        {
-            'name': 'Card 1',
-            'qfmt': '''
+        return FAILED_RESULT
+
+@metrics.timed("generate_word")
+def generate_translation_sentence_image_audio(nepali_word):
+    """Generate translations, sentences, image, and audio for a Nepali word."""
+    try:
+        parsed = translate_word(get_client("openai"), nepali_word)
+    except Exception as e:
+        print(f"Error generating for {nepali_word}: {e}")
+        return FAILED_RESULT
+    return collect_result(nepali_word, parsed, submit_media(nepali_word, parsed))
+
+@metrics.timed("generate_batch")
+def generate_batch(nepali_words):
+    """Generate translations, sentences, images, and audio for a batch of words, in order."""
+    translated = translate_batch(get_client("openai"), nepali_words)
+    # Start media for the whole batch before waiting on any of it.
+    media_futures = {nepali_word: submit_media(nepali_word, parsed) for nepali_word, parsed in translated.items()}
+    results = []
+    for nepali_word in nepali_words:
+        if nepali_word in translated:
+            results.append(collect_result(nepali_word, translated[nepali_word], media_futures[nepali_word]))
+        else:
+            results.append(FAILED_RESULT)
+    return results
+
+def generate_notes(nepali_words, batch_size, store=None):
+    """Generate and store notes for nepali_words in order; return the words that failed.
+
+    nepali_words can be any iterable; it is consumed only as fast as
+    batches are submitted. Finished notes are checkpointed to the store's
+    journal as they arrive; store defaults to the one for processed_notes.json.
+    """
+    if store is None:
+        store = open_store(notes_file)
+    failed_words = []
+    words = iter(nepali_words)
+    batches = iter(lambda: list(islice(words, batch_size)), [])
+
+    def store_batch(batch, future):
+        for nepali_word, result in zip(batch, future.result()):
+            if result is FAILED_RESULT:
+                # Keep "N/A" placeholders out of the store; the word goes on
+                # the retry queue instead.
+                failed_words.append(nepali_word)
+                continue
+
+            english, romanized_word, nepali_sentence, romanized_sentence, english_sentence, image_file_name, word_audio, sentence_audio = result
+
+            # A word that is already stored (being regenerated) keeps its index.
+            new_note = {
+                "nepali": nepali_word,
+                "romanized": romanized_word,
+                "english": english,
+                "sentence": nepali_sentence,
+                "romanized_sentence": romanized_sentence,
+                "english_sentence": english_sentence,
+                "image": image_file_name or '',
+                "word_audio": word_audio or '',
+                "sentence_audio": sentence_audio or '',
+                **TRANSLATION_VERSION,
+            }
+            store.upsert_numbered(new_note)
+
+    # Submit lazily with CONCURRENCY batches running and one queued, instead
+    # of executor.map, which would read the whole word list up front. Batches
+    # are stored in submission order, so notes are appended and numbered
+    # exactly as in a serial run.
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as word_executor:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append((batch, word_executor.submit(generate_batch, batch)))
+            if len(in_flight) > CONCURRENCY:
+                store_batch(*in_flight.popleft())
+        while in_flight:
+            store_batch(*in_flight.popleft())
+    return failed_words
+
+def write_deck(notes, output_file='Nepali-1K.apkg', deck_id=2059400110, deck_name='Nepali 1k'):
+    """Package notes with their optimized media into output_file."""
+    import genanki
+    from incremental_package import DeckBuild, note_guid
+
+    model = genanki.Model(
+        1607392319,
+        'Nepali Words Model',
+        fields=[
+            {'name': 'Index'},
+            {'name': 'Nepali'},
+            {'name': 'Romanized'},
+            {'name': 'English'},
+            {'name': 'Sentence'},
+            {'name': 'Romanized Sentence'},
+            {'name': 'English Sentence'},
+            {'name': 'Image'},
+            {'name': 'Word Audio'},
+            {'name': 'Sentence Audio'}
+        ],
+        templates=[
+            {
+                'name': 'Card 1',
+                'qfmt': '''
 <div id="nepali-word" class="nepali-text">{{Nepali}}</div>
 <div id="romanized-word" class="hidden">{{Romanized}}</div>
 <hr>
@@ -234,7 +210,7 @@ model = genanki.Model(
   document.getElementById('sentence').addEventListener('click', () => toggleVisibility('romanized-sentence'));
 </script>
 ''',
-            'afmt': '''
+                'afmt': '''
 <div class="nepali-text">{{Nepali}}</div>
 <div class="romanized">{{Romanized}}</div>
 <div class="english">{{English}}</div>
@@ -251,13 +227,13 @@ model = genanki.Model(
 <div></div>
 {{#Word Audio}}
 <audio controls>
-  <source src="{{Word Audio}}" type="audio/mpeg">
+  <source src="{{Word Audio}}">
 </audio>
 {{/Word Audio}}
 '''
-        }
-    ],
-    css='''
+            }
+        ],
+        css='''
 .hidden {
   display: none;
 }
@@ -272,33 +248,113 @@ model = genanki.Model(
   color: #55dd55;
 }
 '''
-)
-
-deck = genanki.Deck(2059400110, 'Nepali 1k')
-media_files = []
-
-for note in notes:
-    fields = [
-        str(note["index"]), note["nepali"], note["romanized"], note["english"],
-        note["sentence"], note["romanized_sentence"], note["english_sentence"],
-        note["image"], f"[sound:{note['word_audio']}]", f"[sound:{note['sentence_audio']}]"
-    ]
-    anki_note = genanki.Note(
-        model=model,
-        fields=fields
     )
-    deck.add_note(anki_note)
 
-    if note["image"]:
-        media_files.append(str(image_dir / note["image"]))
-    if note["word_audio"]:
-        media_files.append(str(audio_dir / note["word_audio"]))
-    if note["sentence_audio"]:
-        media_files.append(str(audio_dir / note["sentence_audio"]))
-
-package = genanki.Package(deck)
-package.media_files = media_files
-output_file = 'Nepali-1K.apkg'
-package.write_to_file(output_file)
-
-print(f"Anki deck created with online images and audio: {output_file}")
+    build = DeckBuild()
+    deck = build.add_deck(deck_id, deck_name)
+
+    # Resized images and normalized audio; the originals stay untouched.
+    optimized_images = optimize_images(image_dir, [note["image"] for note in notes])
+    transcoded_audio = transcode_audio(audio_dir, [note[field] for note in notes for field in ("word_audio", "sentence_audio")])
+
+    for note in notes:
+        image = optimized_images.get(note["image"])
+        word_audio = transcoded_audio.get(note["word_audio"])
+        sentence_audio = transcoded_audio.get(note["sentence_audio"])
+        fields = [
+            str(note["index"]), note["nepali"], note["romanized"], note["english"],
+            note["sentence"], note["romanized_sentence"], note["english_sentence"],
+            image.name if image else '',
+            f"[sound:{word_audio.name}]" if word_audio else '',
+            f"[sound:{sentence_audio.name}]" if sentence_audio else ''
+        ]
+        anki_note = genanki.Note(
+            model=model,
+            fields=fields,
+            guid=note_guid(note["nepali"])
+        )
+        build.add_note(deck, anki_note, media=[image, word_audio, sentence_audio])
+
+    build.write_package(output_file)
+
+    print(f"Anki deck created with online images and audio: {output_file}")
+
+def pending_words(store=None):
+    """Words from the word list that have no note yet, read lazily."""
+    if store is None:
+        store = open_store(notes_file)
+    return (nepali_word for nepali_word, _ in load_translations() if nepali_word not in store)
+
+def generate(batch_size=BATCH_SIZE, output_file='Nepali-1K.apkg', package=True):
+    """Generate notes for every pending word, then package the deck."""
+    store = open_store(notes_file)
+    retry_queue = generate_notes(pending_words(store), batch_size, store)
+    if retry_queue:
+        # Words that exhausted their per-request retries get one more pass, one
+        # word per request, once the providers have had time to recover.
+        print(f"Retrying {len(retry_queue)} failed words in {RETRY_QUEUE_DELAY}s")
+        time.sleep(RETRY_QUEUE_DELAY)
+        retry_queue = generate_notes(retry_queue, 1, store)
+    if retry_queue:
+        print(f"Skipped {len(retry_queue)} words that kept failing; they will be retried next run: {', '.join(retry_queue)}")
+
+    store.save()
+    if package:
+        write_deck(store.notes, output_file)
+
+TEXT_FIELDS = ("english", "romanized", "sentence", "romanized_sentence", "english_sentence")
+
+def translation_problem(note, outdated=False):
+    """Why a stored note needs translating again ("failed" or "outdated"), or None."""
+    if any(note.get(field) in (None, '', "N/A") for field in TEXT_FIELDS):
+        return "failed"
+    if outdated and any(note.get(key) != value for key, value in TRANSLATION_VERSION.items()):
+        return "outdated"
+    return None
+
+def missing_media(note):
+    """The media fields of a note that were never fetched or whose file is gone."""
+    directories = {"image": image_dir, "word_audio": audio_dir, "sentence_audio": audio_dir}
+    return [field for field in directories if not note.get(field) or not (directories[field] / note[field]).exists()]
+
+def regenerate(batch_size=BATCH_SIZE, outdated=False, output_file='Nepali-1K.apkg', package=True, dry_run=False):
+    """Redo only the failed, partial or (with outdated) out-of-date notes.
+
+    Failed and outdated notes are translated again with their media; notes
+    that only lack media just have that media fetched. Notes are patched in
+    place and keep their index.
+    """
+    import media_verify
+
+    store = open_store(notes_file)
+    translate = [note["nepali"] for note in store.notes if translation_problem(note, outdated)]
+    retranslated = set(translate)
+    repairs = [
+        {"nepali": note["nepali"], "field": field, "file": None, "problem": "missing"}
+        for note in store.notes if note["nepali"] not in retranslated
+        for field in missing_media(note)
+    ]
+    print(f"{len(translate)} notes to translate again, {len(repairs)} missing media files to fetch")
+    if dry_run:
+        for note in store.notes:
+            problem = translation_problem(note, outdated)
+            if problem:
+                print(f"{note['index']:>6}  {note['nepali']}: {problem}")
+        for entry in repairs:
+            print(f"{store.get(entry['nepali'])['index']:>6}  {entry['nepali']}: no {entry['field']}")
+        return
+
+    failed = generate_notes(translate, batch_size, store)
+    if failed:
+        print(f"{len(failed)} notes failed again and were left as they were: {', '.join(failed)}")
+    store.save()
+    if repairs:
+        media_verify.repair(store, repairs, image_dir, audio_dir, workers=CONCURRENCY * 3)
+    if package:
+        write_deck(store.notes, output_file)
+
+# Guarded so the image optimizer's worker processes can import this module.
+if __name__ == "__main__":
+    load_dotenv()
+    generate()
+    metrics.report()
@@ -1,116 +1,67 @@
-import os
-import json
 from pathlib import Path
-import requests
-import genanki
 from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-PIXABAY_API_KEY = os.getenv('PIXABAY_API_KEY')
-NARAKEET_API_KEY = os.getenv('NARAKEET_API_KEY')
-
-# Directories
+from note_store import open_store
+import images
+import metrics
+from image_optimize import optimize_images
+from audio_transcode import transcode_audio
+import tts
+
+# Directories, created on first use by the media caches
 image_dir = Path(r"C:\anki_images")
 audio_dir = Path(r"C:\anki_audio")
-image_dir.mkdir(exist_ok=True)
-audio_dir.mkdir(exist_ok=True)
 notes_file = Path(r"processed_notes.json")
 
-# Load notes
-if not notes_file.exists():
-    raise FileNotFoundError("processed_notes.json not found.")
-
-with open(notes_file, 'r', encoding='utf-8') as file:
-    notes = json.load(file)
-
-# Function to fetch audio using Narakeet API
-def fetch_audio(text, file_name):
-    try:
-        audio_file_path = audio_dir / file_name
-
-        if audio_file_path.exists():
-            return file_name  # Return only the short filename
+# Audio comes from Narakeet unless TTS_PROVIDER says otherwise.
+NARAKEET_VOICE = "lhakpa"
+VOICE = tts.NarakeetVoice(NARAKEET_VOICE)
 
-        url = f"https://api.narakeet.com/text-to-speech/m4a?voice=lhakpa"
-        headers = {
-            'Accept': 'application/octet-stream',
-            'Content-Type': 'text/plain',
-            'x-api-key': NARAKEET_API_KEY,
-        }
-        response = requests.post(url, headers=headers, data=text.encode('utf-8'))
-
-        if response.status_code == 200:
-            with open(audio_file_path, 'wb') as f:
-                f.write(response.content)
-            return file_name  # Return only the short filename
-        else:
-            print(f"Error fetching audio: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        print(f"Error generating audio for '{text}': {e}")
-        return None
-
-# Function to fetch image using Pixabay API
+# Images come from the same cache as gen_cards.py, so words it already
+# illustrated are not downloaded again.
 def fetch_image(english_word):
-    try:
-        if not english_word:
-            return None
-
-        image_file_name = f"{english_word.replace(' ', '_')}.jpg"
-        image_path = image_dir / image_file_name
-
-        if image_path.exists():
-            return image_file_name  # Return only the short filename
-
-        url = f"https://pixabay.com/api/?key={PIXABAY_API_KEY}&q={english_word}&image_type=photo&per_page=3"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-
-        if data['hits']:
-            img_data = requests.get(data['hits'][0]['largeImageURL']).content
-            with open(image_path, 'wb') as handler:
-                handler.write(img_data)
-            return image_file_name  # Return only the short filename
-        else:
-            return None
-    except Exception as e:
-        print(f"Error fetching image for '{english_word}': {e}")
-        return None
-
-notes = notes
-
-for note in notes:
-    nepali_word = note['nepali']
-    nepali_sentence = note['sentence']
-    english_word = note['english']
-
-    # Fetch audio and image
-    note['word_audio'] = fetch_audio(nepali_word, f"{nepali_word}_word.m4a") or note.get('word_audio', '')
-    note['sentence_audio'] = fetch_audio(nepali_sentence, f"{nepali_word}_sentence.m4a") or note.get('sentence_audio', '')
-    note['image'] = fetch_image(english_word) or note.get('image', '')
-
-# Create Anki Deck
-model = genanki.Model(
-    1607392319,
-    'Nepali Words Model',
-    fields=[
-        {'name': 'Index'},
-        {'name': 'Nepali'},
-        {'name': 'Romanized'},
-        {'name': 'English'},
-        {'name': 'Sentence'},
-        {'name': 'Romanized Sentence'},
-        {'name': 'English Sentence'},
-        {'name': 'Image'},
-        {'name': 'Word Audio'},
-        {'name': 'Sentence Audio'}
-    ],
-    templates=[
-        {
-            'name': 'Card 1',
-            'qfmt': '''
+    return images.fetch_image(english_word, image_dir)  # Return only the short filename
+
+def reaudio(output_file='Nepali-1000.apkg'):
+    """Rebuild the deck from processed_notes.json with Narakeet audio."""
+    import genanki
+    from incremental_package import DeckBuild, note_guid
+
+    # Load notes
+    if not notes_file.exists():
+        raise FileNotFoundError("processed_notes.json not found.")
+    store = open_store(notes_file)
+
+    # Work on copies so the Narakeet file names only end up in this deck, not
+    # in processed_notes.json.
+    notes = [dict(note) for note in store]
+
+    # Fetch audio, as many notes at once as the provider allows, and images
+    audio = tts.speak_pairs(tts.voice_for(VOICE), [(note['nepali'], note['sentence']) for note in notes], audio_dir)
+    for note, (word_file, sentence_file) in zip(notes, audio):
+        note['word_audio'] = word_file or note.get('word_audio', '')
+        note['sentence_audio'] = sentence_file or note.get('sentence_audio', '')
+        note['image'] = fetch_image(note['english']) or note.get('image', '')
+
+    # Create Anki Deck
+    model = genanki.Model(
+        1607392319,
+        'Nepali Words Model',
+        fields=[
+            {'name': 'Index'},
+            {'name': 'Nepali'},
+            {'name': 'Romanized'},
+            {'name': 'English'},
+            {'name': 'Sentence'},
+            {'name': 'Romanized Sentence'},
+            {'name': 'English Sentence'},
+            {'name': 'Image'},
+            {'name': 'Word Audio'},
+            {'name': 'Sentence Audio'}
+        ],
+        templates=[
+            {
+                'name': 'Card 1',
+                'qfmt': '''
 <div>{{Nepali}}</div>
 <div>{{Romanized}}</div>
 <hr>
@@ -119,62 +70,66 @@ model = genanki.Model(
 <img src="{{Image}}" alt="Image">
 {{/Image}}
 <audio controls>
-  <source src="{{Word Audio}}" type="audio/mpeg">
+  <source src="{{Word Audio}}">
 </audio>
 <audio controls>
-  <source src="{{Sentence Audio}}" type="audio/mpeg">
+  <source src="{{Sentence Audio}}">
 </audio>
 ''',
-            'afmt': '''
+                'afmt': '''
 <div>{{English}}</div>
 <div>{{Romanized Sentence}}</div>
 {{#Image}}
 <img src="{{Image}}" alt="Image">
 {{/Image}}
 <audio controls>
-  <source src="{{Word Audio}}" type="audio/mpeg">
+  <source src="{{Word Audio}}">
 </audio>
 <audio controls>
-  <source src="{{Sentence Audio}}" type="audio/mpeg">
+  <source src="{{Sentence Audio}}">
 </audio>
 ''',
-        }
-    ],
-)
-
-deck = genanki.Deck(2059400110, 'Nepali 1000')
-media_files = []
-
-for note in notes:  
-    fields = [
-        str(note["index"]),
-        note["nepali"],
-        note["romanized"],
-        note["english"],
-        note["sentence"],
-        note["romanized_sentence"],
-        note["english_sentence"],
-        note["image"] if note["image"] else '',
-        f"[sound:{note['word_audio']}]" if note['word_audio'] else '',
-        f"[sound:{note['sentence_audio']}]" if note['sentence_audio'] else ''
-    ]
-    anki_note = genanki.Note(
-        model=model,
-        fields=fields
+            }
+        ],
     )
-    print("Note Created: ", note)
-    deck.add_note(anki_note)
-
-    if note["image"]:
-        media_files.append(str(image_dir / note["image"]))
-    if note["word_audio"]:
-        media_files.append(str(audio_dir / note["word_audio"]))
-    if note["sentence_audio"]:
-        media_files.append(str(audio_dir / note["sentence_audio"]))
-
-package = genanki.Package(deck)
-package.media_files = media_files
-output_file = 'Nepali-1000.apkg'
-package.write_to_file(output_file)
 
-print(f"Deck Created {output_file}")
\ No newline at end of file
+    build = DeckBuild()
+    deck = build.add_deck(2059400110, 'Nepali 1000')
+
+    # Resized images and normalized audio; the originals stay untouched.
+    optimized_images = optimize_images(image_dir, [note["image"] for note in notes])
+    transcoded_audio = transcode_audio(audio_dir, [note[field] for note in notes for field in ("word_audio", "sentence_audio")])
+
+    for note in notes:  
+        image = optimized_images.get(note["image"])
+        word_audio = transcoded_audio.get(note["word_audio"])
+        sentence_audio = transcoded_audio.get(note["sentence_audio"])
+        fields = [
+            str(note["index"]),
+            note["nepali"],
+            note["romanized"],
+            note["english"],
+            note["sentence"],
+            note["romanized_sentence"],
+            note["english_sentence"],
+            image.name if image else '',
+            f"[sound:{word_audio.name}]" if word_audio else '',
+            f"[sound:{sentence_audio.name}]" if sentence_audio else ''
+        ]
+        anki_note = genanki.Note(
+            model=model,
+            fields=fields,
+            guid=note_guid(note["nepali"])
+        )
+        print("Note Created: ", note)
+        build.add_note(deck, anki_note, media=[image, word_audio, sentence_audio])
+
+    build.write_package(output_file)
+
+    print(f"Deck Created {output_file}")
+
+# Guarded so the image optimizer's worker processes can import this module.
+if __name__ == "__main__":
+    load_dotenv()
+    reaudio()
+    metrics.report()
\ No newline at end of file
@@ -1,38 +1,14 @@
-import genanki
 import os
 from pathlib import Path
-import re
-import base64
 from dotenv import load_dotenv
-from openai import OpenAI
+import metrics
+import tts
+from audio_transcode import transcode_audio
 
-# Load environment variables
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-# Setup directories for media files
+# Directory for media files, created on first use by the media cache
 audio_dir = Path(r"C:\anki_audio\scripts")
-audio_dir.mkdir(exist_ok=True)
 
-# Model for Devanagari deck
-model = genanki.Model(
-    1607392320,
-    'Devanagari Model',
-    fields=[
-        {'name': 'Devanagari'},
-        {'name': 'Romanized'},
-        {'name': 'Approximate Sound'},
-        {'name': 'Audio'},
-    ],
-    templates=[
-        {
-            'name': 'Card 1',
-            'qfmt': '{{Devanagari}}<br>{{Approximate Sound}}',
-            'afmt': '{{FrontSide}}<hr id="answer">{{Romanized}}<br>{{#Audio}}<audio controls><source src="{{Audio}}" type="audio/mpeg"></audio>{{/Audio}}',
-        }
-    ],
-    css="""
+MODEL_CSS = """
     .card {
         font-family: Arial, sans-serif;
         text-align: center;
@@ -41,137 +17,142 @@ model = genanki.Model(
         background-color: white;
     }
     """
-)
+
+# Model for Devanagari deck
+def make_model():
+    import genanki
+    return genanki.Model(
+        1607392320,
+        'Devanagari Model',
+        fields=[
+            {'name': 'Devanagari'},
+            {'name': 'Romanized'},
+            {'name': 'Approximate Sound'},
+            {'name': 'Audio'},
+        ],
+        templates=[
+            {
+                'name': 'Card 1',
+                'qfmt': '{{Devanagari}}<br>{{Approximate Sound}}',
+                'afmt': '{{FrontSide}}<hr id="answer">{{Romanized}}<br>{{#Audio}}<audio controls><source src="{{Audio}}"></audio>{{/Audio}}',
+            }
+        ],
+        css=MODEL_CSS
+    )
 
 # Vowel data
 vowels = [
-    ("अ", "a", "shut", "a.mp3"),
-    ("आ", "ā", "father", "aa.mp3"),
-    ("इ", "i", "free", "i.mp3"),
-    ("ई", "ī", "free", "ii.mp3"),
-    ("उ", "u", "boot", "u.mp3"),
-    ("ऊ", "ū", "boot", "uu.mp3"),
-    ("ए", "e", "may", "e.mp3"),
-    ("ऐ", "ai", "a+i (like night)", "ai.mp3"),
-    ("ओ", "o", "oh", "o.mp3"),
-    ("औ", "au", "a+u (like yowl)", "au.mp3"),
+    ("अ", "a", "shut"),
+    ("आ", "ā", "father"),
+    ("इ", "i", "free"),
+    ("ई", "ī", "free"),
+    ("उ", "u", "boot"),
+    ("ऊ", "ū", "boot"),
+    ("ए", "e", "may"),
+    ("ऐ", "ai", "a+i (like night)"),
+    ("ओ", "o", "oh"),
+    ("औ", "au", "a+u (like yowl)"),
 ]
 
 # Consonant data
 consonants = [
-    ("क", "k(a)", "alcohol", "ka.mp3"),
-    ("ख", "kh(a)", "Khalifa", "kha.mp3"),
-    ("ग", "g(a)", "gun", "ga.mp3"),
-    ("घ", "gh(a)", "Ghana", "gha.mp3"),
-    ("ङ", "ṅ(a)", "sing", "nga.mp3"),
-    ("च", "c(a)", "cats", "ca.mp3"),
-    ("छ", "ch(a)", "cats (with more aspiration)", "cha.mp3"),
-    ("ज", "j(a)", "jug", "ja.mp3"),
-    ("झ", "jh(a)", "jug (with more aspiration)", "jha.mp3"),
-    ("ञ", "ñ(a)", "canyon", "nya.mp3"),
-    ("ट", "ṭ(a)", "master", "ta.mp3"),
-    ("ठ", "ṭh(a)", "Thomas", "tha.mp3"),
-    ("ड", "ḍ(a)", "dog", "da.mp3"),
-    ("ढ", "ḍh(a)", "dog (with more aspiration)", "dha.mp3"),
-    ("ण", "ṇ(a)", "panda", "na.mp3"),
-    ("त", "t(a)", "like the Spanish 't'", "ta2.mp3"),
-    ("थ", "th(a)", "thunder", "tha2.mp3"),
-    ("द", "d(a)", "the (rhymes with uh)", "da2.mp3"),
-    ("ध", "dh(a)", "the (with more aspiration)", "dha2.mp3"),
-    ("न", "n(a)", "nun", "na2.mp3"),
-    ("प", "p(a)", "spun", "pa.mp3"),
-    ("फ", "ph(a)", "fun", "pha.mp3"),
-    ("ब", "b(a)", "bun", "ba.mp3"),
-    ("भ", "bh(a)", "vault", "bha.mp3"),
-    ("म", "m(a)", "mall", "ma.mp3"),
-    ("य", "y(a)", "yawn", "ya.mp3"),
-    ("र", "r(a)", "run", "ra.mp3"),
-    ("ल", "l(a)", "lawn", "la.mp3"),
-    ("व", "w(a)/v(a)", "want", "va.mp3"),
-    ("श", "ś(a)", "shawl", "sha.mp3"),
-    ("ष", "ṣ(a)", "shawl", "sha2.mp3"),
-    ("स", "s(a)", "sun", "sa.mp3"),
-    ("ह", "h(a)", "hum", "ha.mp3"),
+    ("क", "k(a)", "alcohol"),
+    ("ख", "kh(a)", "Khalifa"),
+    ("ग", "g(a)", "gun"),
+    ("घ", "gh(a)", "Ghana"),
+    ("ङ", "ṅ(a)", "sing"),
+    ("च", "c(a)", "cats"),
+    ("छ", "ch(a)", "cats (with more aspiration)"),
+    ("ज", "j(a)", "jug"),
+    ("झ", "jh(a)", "jug (with more aspiration)"),
+    ("ञ", "ñ(a)", "canyon"),
+    ("ट", "ṭ(a)", "master"),
+    ("ठ", "ṭh(a)", "Thomas"),
+    ("ड", "ḍ(a)", "dog"),
+    ("ढ", "ḍh(a)", "dog (with more aspiration)"),
+    ("ण", "ṇ(a)", "panda"),
+    ("त", "t(a)", "like the Spanish 't'"),
+    ("थ", "th(a)", "thunder"),
+    ("द", "d(a)", "the (rhymes with uh)"),
+    ("ध", "dh(a)", "the (with more aspiration)"),
+    ("न", "n(a)", "nun"),
+    ("प", "p(a)", "spun"),
+    ("फ", "ph(a)", "fun"),
+    ("ब", "b(a)", "bun"),
+    ("भ", "bh(a)", "vault"),
+    ("म", "m(a)", "mall"),
+    ("य", "y(a)", "yawn"),
+    ("र", "r(a)", "run"),
+    ("ल", "l(a)", "lawn"),
+    ("व", "w(a)/v(a)", "want"),
+    ("श", "ś(a)", "shawl"),
+    ("ष", "ṣ(a)", "shawl"),
+    ("स", "s(a)", "sun"),
+    ("ह", "h(a)", "hum"),
 ]
 
 # Vowel diacritics data
 diacritics = [
-    ("प", "a", "spun", "pa.mp3"),
-    ("पा", "ā", "father", "paa.mp3"),
-    ("पि", "i", "free", "pi.mp3"),
-    ("पी", "ī", "free", "pii.mp3"),
-    ("पु", "u", "boot", "pu.mp3"),
-    ("पू", "ū", "boot", "puu.mp3"),
-    ("पे", "e", "may", "pe.mp3"),
-    ("पै", "ai", "a+i (like night)", "pai.mp3"),
-    ("पो", "o", "oh", "po.mp3"),
-    ("पौ", "au", "a+u (like yowl)", "pau.mp3"),
+    ("प", "a", "spun"),
+    ("पा", "ā", "father"),
+    ("पि", "i", "free"),
+    ("पी", "ī", "free"),
+    ("पु", "u", "boot"),
+    ("पू", "ū", "boot"),
+    ("पे", "e", "may"),
+    ("पै", "ai", "a+i (like night)"),
+    ("पो", "o", "oh"),
+    ("पौ", "au", "a+u (like yowl)"),
 ]
 
-# Create decks
-vowel_deck = genanki.Deck(2059400120, 'Devanagari Vowels')
-consonant_deck = genanki.Deck(2059400130, 'Devanagari Consonants')
-diacritics_deck = genanki.Deck(2059400140, 'Devanagari Vowel Diacritics')
-
-media_files = []
-
-def gen_audio(text, file_name):
-    try:
-        audio_file_path = audio_dir / file_name
-
-        if audio_file_path.exists() and audio_file_path.stat().st_size > 0:
-            return file_name
-
-        cleaned_text = re.sub(r'<.*?>', '', text)
+# (deck id, deck name, rows, per-deck output file)
+ALPHABET_DECKS = [
+    (2059400120, 'Devanagari Vowels', vowels, 'Devanagari_Vowels.apkg'),
+    (2059400130, 'Devanagari Consonants', consonants, 'Devanagari_Consonants.apkg'),
+    (2059400140, 'Devanagari Vowel Diacritics', diacritics, 'Devanagari_Vowel_Diacritics.apkg'),
+]
 
-        completion = client.chat.completions.create(
-            model="gpt-4o-audio-preview",
-            modalities=["text", "audio"],
-            audio={"voice": "alloy", "format": "mp3"},
-            messages=[
-                {
-                    "role": "user",
-                    "content": "Say this: " + cleaned_text
-                }
-            ]
-        )
+# Set SINGLE_PACKAGE=1 to write all three decks into one Devanagari.apkg
+SINGLE_PACKAGE = os.getenv("SINGLE_PACKAGE", "0") == "1"
 
-        mp3_bytes = base64.b64decode(completion.choices[0].message.audio.data)
-        with open(audio_file_path, "wb") as f:
-            f.write(mp3_bytes)
+# TTS_PROVIDER (e.g. local for offline drafts) swaps in another provider.
+VOICE = tts.OpenAIVoice(system_prompt=None, user_prefix="Say this: ")
 
-        return file_name
-    except Exception as e:
-        print(f"Error generating audio for '{text}': {e}")
-        return None
+def add_notes_to_deck(build, model, deck, data):
+    import genanki
+    from incremental_package import note_guid
 
-def add_notes_to_deck(deck, data):
-    for devanagari, romanized, approx_sound, audio in data:
-        audio = gen_audio(devanagari, audio)  # Generate audio dynamically
+    audio_files = tts.speak_all(tts.voice_for(VOICE), [devanagari for devanagari, _, _ in data], audio_dir)
+    transcoded_audio = transcode_audio(audio_dir, audio_files)
+    for (devanagari, romanized, approx_sound), audio_file in zip(data, audio_files):
+        audio = transcoded_audio.get(audio_file)
         note = genanki.Note(
             model=model,
-            fields=[devanagari, romanized, approx_sound, f"[sound:{audio}]"],
+            fields=[devanagari, romanized, approx_sound, f"[sound:{audio.name}]" if audio else ""],
+            guid=note_guid(deck.deck_id, devanagari),
         )
-        deck.add_note(note)
-        if audio:
-            media_files.append(str(audio_dir / audio))
-
-# Add notes to decks
-add_notes_to_deck(vowel_deck, vowels)
-add_notes_to_deck(consonant_deck, consonants)
-add_notes_to_deck(diacritics_deck, diacritics)
-
-# Save the decks to .apkg files
-vowel_package = genanki.Package(vowel_deck)
-vowel_package.media_files = media_files
-vowel_package.write_to_file('Devanagari_Vowels.apkg')
-
-consonant_package = genanki.Package(consonant_deck)
-consonant_package.media_files = media_files
-consonant_package.write_to_file('Devanagari_Consonants.apkg')
-
-diacritics_package = genanki.Package(diacritics_deck)
-diacritics_package.media_files = media_files
-diacritics_package.write_to_file('Devanagari_Vowel_Diacritics.apkg')
-
-print("Anki decks created: Devanagari_Vowels.apkg, Devanagari_Consonants.apkg, Devanagari_Vowel_Diacritics.apkg")
+        build.add_note(deck, note, media=[audio])
+
+def generate_alphabet(single_package=SINGLE_PACKAGE):
+    """Build the vowel, consonant and diacritic decks."""
+    from incremental_package import DeckBuild
+
+    # Create decks; each one tracks only the audio its own notes use
+    build = DeckBuild()
+    model = make_model()
+    for deck_id, deck_name, rows, _ in ALPHABET_DECKS:
+        add_notes_to_deck(build, model, build.add_deck(deck_id, deck_name), rows)
+
+    # Save the decks to .apkg files
+    if single_package:
+        build.write_package('Devanagari.apkg')
+        print("Anki deck created: Devanagari.apkg")
+    else:
+        output_files = {deck_id: output_file for deck_id, _, _, output_file in ALPHABET_DECKS}
+        build.write_packages(output_files)
+        print(f"Anki decks created: {', '.join(output_files.values())}")
+
+if __name__ == "__main__":
+    load_dotenv()
+    generate_alphabet()
+    metrics.report()
@@ -0,0 +1,65 @@
+"""Shared HTTP session with connection pooling and streamed downloads.
+
+All plain-HTTP providers (Pixabay, its image CDN, Narakeet) go through one
+requests.Session so connections are kept alive and reused across threads
+instead of paying a TCP and TLS handshake per request. Large bodies are
+streamed to disk in chunks rather than buffered in memory.
+
+requests speaks HTTP/1.1 only; with keep-alive the per-request cost is
+already a single round trip, so HTTP/2 is not worth a second client here.
+"""
+import os
+import threading
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Connections kept open per host; match it to the number of worker threads.
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = (10, 60)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def get(url, **kwargs):
+    kwargs.setdefault("timeout", TIMEOUT)
+    response = get_session().get(url, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+def write_stream(response, path):
+    """Write a streamed response body to path, removing it if the transfer fails."""
+    try:
+        with open(path, 'wb') as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                metrics.count("bytes_downloaded", len(chunk))
+    except BaseException:
+        Path(path).unlink(missing_ok=True)
+        raise
+    finally:
+        response.close()
+    return path
+
+
+def download(url, path, **kwargs):
+    """Stream url into path and return path."""
+    return write_stream(get(url, stream=True, **kwargs), path)
@@ -0,0 +1,102 @@
+"""Downscale and recompress images before they are packaged.
+
+Pixabay's largeImageURL is typically a 1280px JPEG of a few hundred KB,
+far more than a card needs. optimize_images resizes each image to fit a
+card-sized box and re-encodes it as WebP (or a tuned JPEG) in a process
+pool. The pool spawns fresh interpreters rather than forking, because the
+worker and the generator call this from a thread while other threads hold
+locks and open connections. Results are cached under <image_dir>/optimized/<profile>/, named
+after the source file's content hash, so re-runs only process new images.
+
+Requires Pillow; without it the original images are packaged unchanged.
+"""
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import metrics
+
+# Longest side in pixels, output format ("webp" or "jpeg") and quality.
+IMAGE_MAX_SIZE = int(os.getenv("IMAGE_MAX_SIZE", "480"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "70"))
+
+EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg"}
+CHUNK_SIZE = 64 * 1024
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def optimize_one(source, destination, max_size, image_format, quality):
+    """Resize and re-encode one image. Runs in a worker process."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+        # Per process, so two builds optimizing the same image never share a file.
+        tmp_path = Path(destination).with_name(f"{Path(destination).name}.{os.getpid()}.part")
+        if image_format == "webp":
+            image.save(tmp_path, "WEBP", quality=quality, method=6)
+        else:
+            image.save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+    os.replace(tmp_path, destination)
+    return destination
+
+
+@metrics.timed("optimize_images")
+def optimize_images(image_dir, file_names, max_size=IMAGE_MAX_SIZE, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY, workers=None):
+    """Return {file name: path to package} for the given images in image_dir.
+
+    Images that cannot be optimized map to their original path.
+    """
+    image_dir = Path(image_dir)
+    sources = {name: image_dir / name for name in set(file_names) if name}
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("Pillow is not installed; packaging images without optimizing them.")
+        return sources
+
+    out_dir = image_dir / "optimized" / f"{max_size}px-{image_format}-q{quality}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    optimized = {}
+    jobs = {}
+    cached = 0
+    for name, source in sources.items():
+        if not source.exists():
+            optimized[name] = source
+            continue
+        destination = out_dir / f"{file_hash(source)[:32]}{EXTENSIONS[image_format]}"
+        if destination.exists():
+            optimized[name] = destination
+            cached += 1
+        else:
+            jobs[name] = (source, destination)
+
+    if jobs:
+        print(f"Optimizing {len(jobs)} images ({cached} already cached)")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {
+                name: executor.submit(optimize_one, source, destination, max_size, image_format, quality)
+                for name, (source, destination) in jobs.items()
+            }
+            for name, future in futures.items():
+                try:
+                    optimized[name] = Path(future.result())
+                except Exception as e:
+                    print(f"Error optimizing image '{name}': {e}")
+                    optimized[name] = sources[name]
+    return optimized
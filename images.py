@@ -0,0 +1,33 @@
+"""Pixabay image lookup shared by the deck scripts."""
+import os
+
+import http_pool
+import metrics
+import rate_limit
+from media_cache import open_cache
+
+# Overridable so benchmarks can point it at a local stub server.
+PIXABAY_API_URL = os.getenv("PIXABAY_API_URL", "https://pixabay.com/api/")
+
+
+@metrics.timed("fetch_image")
+def fetch_image(english_word, image_dir):
+    """Return the cached file name of a photo for english_word, or None."""
+    try:
+        if not english_word:
+            print(f"No English translation available.")
+            return None
+
+        def download():
+            url = f"{PIXABAY_API_URL}?key={os.getenv('PIXABAY_API_KEY')}&q={english_word}&image_type=photo&per_page=3"
+            data = rate_limit.call("pixabay", http_pool.get, url).json()
+
+            if data['hits']:
+                return rate_limit.call("pixabay_cdn", http_pool.download, data['hits'][0]['largeImageURL'], image_cache.temp_path())
+            return None
+
+        image_cache = open_cache(image_dir)
+        return image_cache.fetch("pixabay", "photo", english_word, ".jpg", download)
+    except Exception as e:
+        print(f"Error fetching image for '{english_word}': {e}")
+        return None
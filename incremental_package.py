@@ -0,0 +1,304 @@
+"""Incremental .apkg builder.
+
+genanki.Package.write_to_file builds a fresh collection database on every
+run. build_package instead keeps the previous build's collection database
+and a manifest of note and media fingerprints under
+.build_cache/<deck>-<hash of the output path>/.
+On the next build it only inserts, updates or deletes the notes whose
+fields changed. When neither the notes nor the media changed, the existing
+package is left alone. The cache directory is locked for the whole build,
+so builds of the same output from several threads or processes take turns.
+
+Notes are matched by GUID, so callers must give them a stable guid (see
+note_guid) instead of genanki's default, which hashes every field and
+changes whenever any of them does.
+
+DeckBuild collects several decks together with the media each one
+references, so they can go out as one multi-deck package or as one
+package per deck that carries only that deck's media.
+"""
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import zipfile
+from pathlib import Path
+
+import genanki
+
+import metrics
+
+CACHE_DIR = Path(".build_cache")
+COMPRESS_LEVEL = 6
+# Formats that deflate cannot shrink any further.
+COMPRESSED_MEDIA = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.m4a', '.ogg', '.opus', '.mp4', '.webm'}
+
+
+_state_locks = {}
+_state_locks_lock = threading.Lock()
+
+
+def state_dir_for(output_file, cache_dir=CACHE_DIR):
+    """Cache directory of output_file, unique to its resolved path."""
+    path_hash = hashlib.sha256(str(Path(output_file).resolve()).encode('utf-8')).hexdigest()[:16]
+    return Path(cache_dir) / f"{Path(output_file).stem}-{path_hash}"
+
+
+@contextmanager
+def locked(state_dir):
+    """Hold state_dir for the calling thread, and for this process against others."""
+    with _state_locks_lock:
+        thread_lock = _state_locks.setdefault(Path(state_dir).resolve(), threading.Lock())
+    with thread_lock, open(Path(state_dir) / 'lock', 'a+b') as lock_file:
+        if os.name == 'nt':
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ten seconds
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def note_guid(*key):
+    """Stable GUID for a note identified by key, e.g. its Nepali word."""
+    return genanki.guid_for(*key)
+
+
+def fingerprint(value):
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def note_fingerprint(note):
+    return fingerprint([note.model.model_id, note._format_fields(), note._format_tags()])
+
+
+def deck_fingerprint(decks):
+    fingerprints = []
+    for deck in decks:
+        models = {note.model.model_id: note.model for note in deck.notes}
+        fingerprints.append([
+            deck.deck_id,
+            deck.name,
+            deck.description,
+            [models[model_id].to_json(0, deck.deck_id) for model_id in sorted(models)],
+        ])
+    return fingerprint(fingerprints)
+
+
+def media_fingerprint(media_files):
+    fingerprints = []
+    for path in media_files:
+        stat = os.stat(path)
+        fingerprints.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return fingerprint(fingerprints)
+
+
+def load_manifest(manifest_file):
+    if manifest_file.exists():
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def rebuild_db(db_file, decks, timestamp):
+    db_file.unlink(missing_ok=True)
+    conn = sqlite3.connect(db_file)
+    id_gen = itertools.count(int(timestamp * 1000))
+    genanki.Package(decks).write_to_db(conn.cursor(), timestamp, id_gen)
+    conn.commit()
+    conn.close()
+
+
+def update_db(db_file, decks, old_notes, timestamp):
+    """Apply note additions, edits and removals to the cached collection.
+
+    Returns the number of notes touched.
+    """
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    max_id = max(
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM notes').fetchone()[0],
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM cards').fetchone()[0],
+    )
+    id_gen = itertools.count(max(int(timestamp * 1000), max_id + 1))
+    current = {note.guid: (deck, note) for deck in decks for note in deck.notes}
+    changed = 0
+
+    removed = [guid for guid in old_notes if guid not in current]
+    for guid in removed:
+        cursor.execute('DELETE FROM cards WHERE nid IN (SELECT id FROM notes WHERE guid = ?)', (guid,))
+        cursor.execute('DELETE FROM notes WHERE guid = ?', (guid,))
+        changed += 1
+
+    for guid, (deck, note) in current.items():
+        if guid not in old_notes:
+            note.write_to_db(cursor, timestamp, deck.deck_id, id_gen)
+            changed += 1
+        elif old_notes[guid] != note_fingerprint(note):
+            cursor.execute(
+                'UPDATE notes SET flds = ?, sfld = ?, tags = ?, mod = ?, usn = -1 WHERE guid = ?',
+                (note._format_fields(), note.sort_field, note._format_tags(), int(timestamp), guid),
+            )
+            changed += 1
+
+    conn.commit()
+    conn.close()
+    return changed
+
+
+def compress_type(path):
+    """Deflate only what it helps; images and audio are already compressed."""
+    if Path(path).suffix.lower() in COMPRESSED_MEDIA:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def write_apkg(db_file, media_files, output_file):
+    """Write the package next to output_file and move it into place.
+
+    genanki stores every entry, including the collection database, which
+    is mostly text and shrinks several times over when deflated. Here the
+    database and the media map are deflated and already-compressed media
+    is stored as is. ZipFile.write copies each file in chunks, so media is
+    streamed into the archive rather than read into memory.
+    """
+    tmp_file = Path(output_file).with_name(Path(output_file).name + '.part')
+    with zipfile.ZipFile(tmp_file, 'w', compresslevel=COMPRESS_LEVEL) as outzip:
+        outzip.write(db_file, 'collection.anki2', compress_type=zipfile.ZIP_DEFLATED)
+
+        media_file_idx_to_path = dict(enumerate(media_files))
+        media_json = {idx: os.path.basename(path) for idx, path in media_file_idx_to_path.items()}
+        outzip.writestr('media', json.dumps(media_json), compress_type=zipfile.ZIP_DEFLATED)
+
+        for idx, path in media_file_idx_to_path.items():
+            outzip.write(path, str(idx), compress_type=compress_type(path))
+    os.replace(tmp_file, output_file)
+
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@metrics.timed("package")
+def build_package(decks, media_files, output_file, cache_dir=CACHE_DIR, timestamp=None):
+    """Write one or more decks and media_files to output_file, reusing the previous build."""
+    if isinstance(decks, genanki.Deck):
+        decks = [decks]
+    if timestamp is None:
+        timestamp = time.time()
+    guids = [note.guid for deck in decks for note in deck.notes]
+    if len(set(guids)) != len(guids):
+        raise ValueError("Notes must have unique GUIDs for incremental builds.")
+
+    state_dir = state_dir_for(output_file, cache_dir)
+    state_dir.mkdir(parents=True, exist_ok=True)
+    with locked(state_dir):
+        build_locked(decks, media_files, output_file, state_dir, timestamp)
+
+
+def build_locked(decks, media_files, output_file, state_dir, timestamp):
+    db_file = state_dir / 'collection.anki2'
+    manifest_file = state_dir / 'manifest.json'
+    manifest = load_manifest(manifest_file)
+
+    # Work on a copy so an interrupted build never leaves the cached
+    # database out of step with its manifest.
+    work_file = state_dir / 'collection.anki2.tmp'
+    deck_hash = deck_fingerprint(decks)
+    media_hash = media_fingerprint(media_files)
+    reusable = (
+        db_file.exists()
+        and manifest.get("deck") == deck_hash
+        and manifest.get("db") == file_fingerprint(db_file)
+    )
+    if not reusable:
+        print(f"Building {output_file} from scratch")
+        rebuild_db(work_file, decks, timestamp)
+    else:
+        shutil.copyfile(db_file, work_file)
+        changed = update_db(work_file, decks, manifest.get("notes", {}), timestamp)
+        if not changed and manifest.get("media") == media_hash and Path(output_file).exists():
+            work_file.unlink()
+            print(f"{output_file} is up to date")
+            return
+        print(f"Updated {changed} notes in {output_file}")
+
+    write_apkg(work_file, media_files, output_file)
+    os.replace(work_file, db_file)
+    tmp_manifest = manifest_file.with_name(manifest_file.name + '.tmp')
+    with open(tmp_manifest, 'w', encoding='utf-8') as f:
+        json.dump({
+            "deck": deck_hash,
+            "media": media_hash,
+            "db": file_fingerprint(db_file),
+            "notes": {note.guid: note_fingerprint(note) for deck in decks for note in deck.notes},
+        }, f)
+    os.replace(tmp_manifest, manifest_file)
+
+
+class DeckBuild:
+    """Decks being built together, with the media each deck's notes reference.
+
+    Media is tracked per deck as a set keyed by file name, so a file added
+    by several notes is packaged once. Media files are named after their
+    content hash, so the same name always means the same content.
+    """
+
+    def __init__(self):
+        self.decks = {}
+        self._media = {}
+
+    def add_deck(self, deck_id, name, **kwargs):
+        deck = genanki.Deck(deck_id, name, **kwargs)
+        self.decks[deck_id] = deck
+        self._media[deck_id] = {}
+        return deck
+
+    def add_note(self, deck, note, media=()):
+        """Add note to deck along with the media paths it references (None entries are skipped)."""
+        deck.add_note(note)
+        for path in media:
+            if path:
+                self._media[deck.deck_id].setdefault(os.path.basename(path), str(path))
+
+    def media_files(self, decks=None):
+        """Media referenced by decks (all decks by default), each file once."""
+        files = {}
+        for deck in decks if decks is not None else self.decks.values():
+            for name, path in self._media[deck.deck_id].items():
+                files.setdefault(name, path)
+        return list(files.values())
+
+    def write_package(self, output_file, **kwargs):
+        """Write every deck into one multi-deck package."""
+        decks = list(self.decks.values())
+        build_package(decks, self.media_files(decks), output_file, **kwargs)
+
+    def write_packages(self, output_files, **kwargs):
+        """Write one package per deck; output_files maps deck ids to file names."""
+        for deck_id, output_file in output_files.items():
+            deck = self.decks[deck_id]
+            build_package(deck, self.media_files([deck]), output_file, **kwargs)
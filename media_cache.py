@@ -0,0 +1,172 @@
+"""Content-addressed cache for generated and downloaded media.
+
+Entries are keyed by a hash of (provider, voice/model, normalized text), so
+the same sentence spoken by the same voice is only ever synthesized once,
+and changing the text or the voice always yields a fresh file. Files are
+named after the hash of their content, which deduplicates identical
+payloads coming from different requests. A JSONL manifest in each media
+directory maps request keys to files.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+import uuid
+from pathlib import Path
+
+import metrics
+
+MANIFEST_NAME = 'media_manifest.jsonl'
+CHUNK_SIZE = 64 * 1024
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def open_cache(directory):
+    """Return the shared cache for directory, loading its manifest on first use."""
+    key = Path(directory).resolve()
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = MediaCache(directory)
+        return _caches[key]
+
+
+def normalize_text(text):
+    text = re.sub(r'<.*?>', '', text)
+    text = unicodedata.normalize('NFC', text)
+    return ' '.join(text.split())
+
+
+def make_key(provider, voice, text):
+    raw = '\0'.join([provider, voice, normalize_text(text)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MediaCache:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest_file = self.directory / MANIFEST_NAME
+        self._entries = {}
+        self._by_content = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, provider, voice, text):
+        """Return the cached file name for a request, or None on a miss."""
+        entry = self._entries.get(make_key(provider, voice, text))
+        if entry and self._intact(entry['file'], entry['size']):
+            return entry['file']
+        return None
+
+    def stored_files(self):
+        """Names of the files this cache stored, which are named after their content hash."""
+        with self._lock:
+            return set(self._by_content.values())
+
+    def temp_path(self):
+        """A fresh path in the cache directory for producers that stream to disk."""
+        return self.directory / f".{uuid.uuid4().hex}.part"
+
+    def put(self, provider, voice, text, data, extension):
+        """Store data for a request and return the file name it was saved as."""
+        tmp_path = self.temp_path()
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return self.put_file(provider, voice, text, tmp_path, extension)
+
+    def put_file(self, provider, voice, text, tmp_path, extension):
+        """Move a finished temp_path() file into the cache and return its file name.
+
+        The rename is atomic, so an interrupted write can never show up as a
+        cached file.
+        """
+        digest = hashlib.sha256()
+        with open(tmp_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        size = os.path.getsize(tmp_path)
+
+        with self._lock:
+            file_name = self._by_content.get(content_hash)
+            if file_name is not None and self._intact(file_name, size):
+                os.unlink(tmp_path)
+            else:
+                file_name = f"{content_hash[:32]}{extension}"
+                os.replace(tmp_path, self.directory / file_name)
+            self._record({
+                'key': make_key(provider, voice, text),
+                'file': file_name,
+                'sha256': content_hash,
+                'size': size,
+                'provider': provider,
+                'voice': voice,
+                'text': normalize_text(text),
+            })
+        return file_name
+
+    def fetch(self, provider, voice, text, extension, produce):
+        """Return the cached file for a request, calling produce() on a miss.
+
+        produce returns the media bytes, a finished temp_path() file, or None
+        when nothing is available. Concurrent callers asking for the same
+        request wait for a single produce() call instead of each paying for it.
+        """
+        key = make_key(provider, voice, text)
+        while True:
+            file_name = self.get(provider, voice, text)
+            if file_name:
+                metrics.count(f"media_cache.{provider}.hit")
+                return file_name
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    break
+            event.wait()
+            if key not in self._entries:
+                return None  # the producing call found nothing or failed
+
+        metrics.count(f"media_cache.{provider}.miss")
+        try:
+            data = produce()
+            if not data:
+                return None
+            if isinstance(data, Path):
+                return self.put_file(provider, voice, text, data, extension)
+            return self.put(provider, voice, text, data, extension)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def _intact(self, file_name, size):
+        # A file that is gone or no longer has the size it was stored with
+        # (emptied or truncated behind the cache's back) counts as a miss.
+        try:
+            return os.path.getsize(self.directory / file_name) == size
+        except OSError:
+            return False
+
+    def _load(self):
+        if not self.manifest_file.exists():
+            return
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from a crash mid-append
+                self._entries[entry['key']] = entry
+                self._by_content[entry['sha256']] = entry['file']
+
+    def _record(self, entry):
+        self._entries[entry['key']] = entry
+        self._by_content[entry['sha256']] = entry['file']
+        with open(self.manifest_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
@@ -0,0 +1,313 @@
+"""Check the media behind the notes and regenerate only what is broken.
+
+The media caches only notice a file that is missing or no longer has the
+size it was stored with. A file of the right size can still be in the
+wrong format, not match its hash or fail to decode, and it would be
+packaged on every run. verify_notes checks every image and audio file
+referenced by the note store, in parallel:
+
+- the file exists and is at least MIN_SIZES bytes;
+- its magic bytes match an image or audio format;
+- files stored by media_cache.py, which names them after their content
+  hash, still match it (the optimized and transcoded copies are named after
+  their source's hash, so they are not checked this way);
+- images decode with Pillow, and audio decodes with ffmpeg and lasts
+  between VERIFY_MIN_AUDIO_SECONDS and VERIFY_MAX_AUDIO_SECONDS.
+
+The decode checks are skipped when Pillow or ffmpeg is not installed.
+Results are kept in a verify_manifest.json in each media directory, keyed
+by file size and modification time, so later runs only check files that
+are new or changed.
+
+Bad or missing assets go on a repair queue, written to REPAIR_QUEUE_FILE.
+repair() deletes the bad files, so the media caches miss on them, fetches
+just those assets again and updates their notes in place.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import metrics
+from media_cache import MANIFEST_NAME, open_cache
+from note_store import MEDIA_FIELDS
+
+VERIFY_MANIFEST_NAME = 'verify_manifest.json'
+REPAIR_QUEUE_FILE = Path(os.getenv("REPAIR_QUEUE_FILE", "repair_queue.json"))
+VERIFY_MIN_AUDIO_SECONDS = float(os.getenv("VERIFY_MIN_AUDIO_SECONDS", "0.2"))
+VERIFY_MAX_AUDIO_SECONDS = float(os.getenv("VERIFY_MAX_AUDIO_SECONDS", "60"))
+# Bump when the checks change, so cached results are not trusted.
+CHECKS_VERSION = 2
+
+MIN_SIZES = {"image": 256, "audio": 256}
+FIELD_KINDS = {"image": "image", "word_audio": "audio", "sentence_audio": "audio"}
+FORMATS = {
+    "image": {"jpeg", "png", "gif", "webp"},
+    "audio": {"mp3", "mp4", "ogg", "wav"},
+}
+CHUNK_SIZE = 64 * 1024
+
+
+def sniff(header):
+    """Name the format of a file from its first 16 bytes, or None."""
+    if header.startswith(b'\xff\xd8\xff'):
+        return "jpeg"
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return "png"
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return "gif"
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return "webp"
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return "wav"
+    if header[:3] == b'ID3' or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return "mp3"
+    if header[4:8] == b'ftyp':
+        return "mp4"
+    if header[:4] == b'OggS':
+        return "ogg"
+    return None
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def have_pillow():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def have_ffmpeg():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def checks_signature():
+    """What the checks can see; cached results from other checks are dropped."""
+    return [CHECKS_VERSION, have_pillow(), have_ffmpeg(), VERIFY_MIN_AUDIO_SECONDS, VERIFY_MAX_AUDIO_SECONDS]
+
+
+def decode_image(path):
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image.load()
+    except Exception as e:
+        return f"does not decode: {e}"
+    return None
+
+
+def decode_audio(path):
+    probe = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", str(path)],
+        capture_output=True, text=True,
+    )
+    try:
+        duration = float(probe.stdout.strip())
+    except ValueError:
+        return f"has no duration: {probe.stderr.strip() or 'ffprobe found no audio'}"
+    if not VERIFY_MIN_AUDIO_SECONDS <= duration <= VERIFY_MAX_AUDIO_SECONDS:
+        return f"lasts {duration:.2f}s"
+    decode = subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", str(path), "-f", "null", "-"],
+        capture_output=True, text=True,
+    )
+    if decode.returncode != 0 or decode.stderr.strip():
+        return f"does not decode: {decode.stderr.strip().splitlines()[0] if decode.stderr.strip() else decode.returncode}"
+    return None
+
+
+def check_file(path, kind, decode=True, content_named=False):
+    """Return None if path holds a usable file of kind ("image" or "audio"), else what is wrong with it.
+
+    With content_named, the file's name must also match its content hash.
+    """
+    path = Path(path)
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        return "missing"
+    if size < MIN_SIZES[kind]:
+        return f"too small ({size} bytes)"
+    with open(path, 'rb') as f:
+        header = f.read(16)
+    file_format = sniff(header)
+    if file_format not in FORMATS[kind]:
+        return f"not an {kind} file ({file_format or 'unknown format'})"
+    if content_named and file_hash(path)[:32] != path.stem:
+        return "content does not match its hash"
+    if not decode:
+        return None
+    if kind == "image" and have_pillow():
+        return decode_image(path)
+    if kind == "audio" and have_ffmpeg():
+        return decode_audio(path)
+    return None
+
+
+def load_manifest(directory):
+    manifest_file = Path(directory) / VERIFY_MANIFEST_NAME
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if manifest.get("checks") != checks_signature():
+        return {}
+    return manifest.get("files", {})
+
+
+def save_manifest(directory, files):
+    manifest_file = Path(directory) / VERIFY_MANIFEST_NAME
+    tmp_file = manifest_file.with_name(manifest_file.name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({"checks": checks_signature(), "files": files}, f)
+    os.replace(tmp_file, manifest_file)
+
+
+def cache_files(directory):
+    """Files directory's media cache stored under their content hash; empty if it has no cache."""
+    if not (Path(directory) / MANIFEST_NAME).exists():
+        return set()
+    return open_cache(directory).stored_files()
+
+
+@metrics.timed("verify_media")
+def verify_files(files, workers=None):
+    """Check (directory, file name, kind) triples; return {triple: problem or None}.
+
+    Files whose size and modification time match the directory's manifest
+    reuse the recorded result; the rest are checked in parallel.
+    """
+    files = set(files)
+    manifests = {directory: load_manifest(directory) for directory, _, _ in files}
+    content_named = {directory: cache_files(directory) for directory in manifests}
+    results = {}
+    stats = {}
+    to_check = []
+    for item in files:
+        directory, name, kind = item
+        try:
+            stat = (Path(directory) / name).stat()
+        except FileNotFoundError:
+            results[item] = "missing"
+            continue
+        stats[item] = [stat.st_size, stat.st_mtime_ns]
+        entry = manifests[directory].get(name)
+        if entry is not None and entry["stat"] == stats[item]:
+            results[item] = entry["problem"]
+        else:
+            to_check.append(item)
+
+    print(f"Verifying {len(to_check)} media files ({len(files) - len(to_check)} unchanged since the last check)")
+    # Decoding happens in Pillow's C code or in ffmpeg, so threads are enough.
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        checked = executor.map(
+            lambda item: check_file(Path(item[0]) / item[1], item[2], content_named=item[1] in content_named[item[0]]),
+            to_check,
+        )
+        for item, problem in zip(to_check, checked):
+            results[item] = problem
+            manifests[item[0]][item[1]] = {"stat": stats[item], "problem": problem}
+            metrics.count("verify_media.bad" if problem else "verify_media.ok")
+
+    for directory, entries in manifests.items():
+        if Path(directory).is_dir():
+            save_manifest(directory, entries)
+    return results
+
+
+def verify_notes(notes, image_dir, audio_dir, workers=None):
+    """Return the repair queue for notes: one entry per bad or missing asset."""
+    directories = {"image": str(image_dir), "word_audio": str(audio_dir), "sentence_audio": str(audio_dir)}
+    files = [
+        (directories[field], note[field], FIELD_KINDS[field])
+        for note in notes for field in MEDIA_FIELDS if note.get(field)
+    ]
+    results = verify_files(files, workers)
+
+    repairs = []
+    for note in notes:
+        for field in MEDIA_FIELDS:
+            name = note.get(field)
+            problem = results[(directories[field], name, FIELD_KINDS[field])] if name else "never generated"
+            if problem:
+                repairs.append({"nepali": note["nepali"], "field": field, "file": name or None, "problem": problem})
+    return repairs
+
+
+def verify_directory(directory, kind, workers=None):
+    """Check every media file in a cache directory; return {file name: problem} for the bad ones."""
+    directory = Path(directory)
+    names = [
+        path.name for path in directory.iterdir()
+        if path.is_file() and not path.name.startswith('.') and path.suffix not in ('.json', '.jsonl', '.tmp')
+    ]
+    results = verify_files([(str(directory), name, kind) for name in names], workers)
+    return {name: problem for (_, name, _), problem in results.items() if problem}
+
+
+def write_repair_queue(repairs, repair_queue_file=REPAIR_QUEUE_FILE):
+    tmp_file = Path(repair_queue_file).with_name(Path(repair_queue_file).name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(repairs, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, repair_queue_file)
+
+
+def discard(directory, name):
+    """Delete a bad file, so the media cache misses on it and fetches it again."""
+    (Path(directory) / name).unlink(missing_ok=True)
+
+
+def regenerate(note, field, image_dir, audio_dir):
+    """Fetch one asset of a note again; return the new file name or None."""
+    import images
+    import tts
+
+    if field == "image":
+        return images.fetch_image(note.get("english"), image_dir)
+    text = note["nepali"] if field == "word_audio" else note["sentence"]
+    return tts.speak(tts.voice_for(tts.OpenAIVoice()), text, audio_dir)
+
+
+def repair(store, repairs, image_dir, audio_dir, workers=8):
+    """Regenerate the assets on the repair queue; return the entries still broken.
+
+    Repaired notes are updated in place, keeping their index and position.
+    """
+    directories = {"image": image_dir, "word_audio": audio_dir, "sentence_audio": audio_dir}
+    for entry in repairs:
+        if entry["file"]:
+            discard(directories[entry["field"]], entry["file"])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (entry, executor.submit(regenerate, store.get(entry["nepali"]), entry["field"], image_dir, audio_dir))
+            for entry in repairs if store.get(entry["nepali"]) is not None
+        ]
+        fixed = {}
+        remaining = []
+        for entry, future in futures:
+            name = future.result()
+            problem = check_file(Path(directories[entry["field"]]) / name, FIELD_KINDS[entry["field"]], content_named=True) if name else "could not be generated"
+            if problem:
+                remaining.append({**entry, "file": name, "problem": problem})
+            else:
+                fixed.setdefault(entry["nepali"], {})[entry["field"]] = name
+
+    for nepali_word, fields in fixed.items():
+        store.upsert({**store.get(nepali_word), **fields})
+    store.save()
+    print(f"Repaired {sum(len(fields) for fields in fixed.values())} assets; {len(remaining)} still broken")
+    return remaining
@@ -0,0 +1,122 @@
+"""Per-stage timing and usage metrics for a run.
+
+Stages are timed with ``timer(stage)`` or the ``timed(stage)`` decorator,
+and counters (cache hits, retries, bytes downloaded, tokens) are bumped
+with ``count(name)``. rate_limit.call times every API request per provider
+and records retries and token usage, so most of this is collected without
+touching the callers.
+
+At the end of a run ``report()`` prints a per-stage summary and writes
+the same numbers to METRICS_FILE as JSON, so runs can be compared.
+"""
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+METRICS_FILE = Path(os.getenv("METRICS_FILE", "metrics.json"))
+# Upper bounds, in seconds, of the latency histogram buckets.
+BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf]
+
+_lock = threading.Lock()
+_timings = defaultdict(list)
+_counters = Counter()
+_started = time.time()
+
+
+def record(stage, seconds):
+    with _lock:
+        _timings[stage].append(seconds)
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] += n
+
+
+@contextmanager
+def timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        count(f"{stage}.errors")
+        raise
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    """Decorator form of timer()."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_usage(provider, response):
+    """Count the tokens an OpenAI-style response reports, per model."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    model = getattr(response, 'model', None) or provider
+    for field in ('prompt_tokens', 'completion_tokens'):
+        tokens = getattr(usage, field, None)
+        if tokens:
+            count(f"tokens.{model}.{field}", tokens)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def snapshot():
+    with _lock:
+        timings = {stage: sorted(values) for stage, values in _timings.items()}
+        counters = dict(_counters)
+    stages = {}
+    for stage, values in sorted(timings.items()):
+        histogram = Counter(next(bound for bound in BUCKETS if value <= bound) for value in values)
+        stages[stage] = {
+            "count": len(values),
+            "total": sum(values),
+            "mean": sum(values) / len(values),
+            "p50": percentile(values, 0.50),
+            "p90": percentile(values, 0.90),
+            "p99": percentile(values, 0.99),
+            "max": values[-1],
+            "histogram": {("inf" if bound == math.inf else str(bound)): histogram[bound] for bound in BUCKETS if histogram[bound]},
+        }
+    return {
+        "started": _started,
+        "wall_time": time.time() - _started,
+        "stages": stages,
+        "counters": dict(sorted(counters.items())),
+    }
+
+
+def report(metrics_file=METRICS_FILE):
+    """Print a summary of the run and write it to metrics_file as JSON."""
+    data = snapshot()
+    print(f"\nRun finished in {data['wall_time']:.1f}s")
+    if data["stages"]:
+        print(f"{'stage':<32} {'count':>7} {'total s':>9} {'p50 s':>8} {'p90 s':>8} {'p99 s':>8} {'max s':>8}")
+        for stage, s in data["stages"].items():
+            print(f"{stage:<32} {s['count']:>7} {s['total']:>9.2f} {s['p50']:>8.3f} {s['p90']:>8.3f} {s['p99']:>8.3f} {s['max']:>8.3f}")
+    for name, value in data["counters"].items():
+        print(f"{name:<32} {value:>7}")
+
+    tmp_file = Path(metrics_file).with_name(Path(metrics_file).name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_file, metrics_file)
+    print(f"Metrics written to {metrics_file}")
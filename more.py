@@ -1,19 +1,13 @@
-import os
 from pathlib import Path
-import genanki
 from dotenv import load_dotenv
-from elevenlabs import ElevenLabs
-
-load_dotenv()
-ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
-
-eleven_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+from romanize import romanize
+import metrics
+import tts
+from audio_transcode import transcode_audio
 
 base_audio_dir = Path(r"C:\anki_audio")
 question_audio_dir = base_audio_dir / "questions2"
 answer_audio_dir = base_audio_dir / "answers2"
-question_audio_dir.mkdir(parents=True, exist_ok=True)
-answer_audio_dir.mkdir(parents=True, exist_ok=True)
 
 qa_data = [
     {
@@ -123,99 +117,98 @@ qa_data = [
     },
 ]
 
-def generate_audio(text, filename, directory):
-    audio_path = directory / filename
-
-    if audio_path.exists():
-        return f"[sound:{audio_path.name}]"
+ELEVENLABS_VOICE_ID = "XrExE9yKIg1WjnnlVkGX"
+ELEVENLABS_MODEL_ID = "eleven_multilingual_v2"
+ELEVENLABS_OUTPUT_FORMAT = "mp3_44100_64"
 
-    try:
-        audio_content = eleven_client.text_to_speech.convert(
-            voice_id="XrExE9yKIg1WjnnlVkGX",  
-            output_format="mp3_44100_64",
-            text=text,
-            model_id="eleven_multilingual_v2",
-        )
-
-        if hasattr(audio_content, "__iter__") and not isinstance(audio_content, (bytes, bytearray)):
-            audio_content = b"".join(audio_content)
+# Keyed on the text itself, so reordering qa_data can never pair a
+# question with another question's audio.
+VOICE = tts.ElevenLabsVoice(ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, ELEVENLABS_OUTPUT_FORMAT)
 
-        with open(audio_path, "wb") as f:
-            f.write(audio_content)
+def create_deck(build, deck_id, deck_name, model, data, audio_dirs):
+    import genanki
+    from incremental_package import note_guid
 
-        return f"[sound:{audio_path.name}]"
-    except Exception as e:
-        print(f"Error generating audio for '{text}': {e}")
-        return ""
+    deck = build.add_deck(deck_id, deck_name)
 
-def create_deck(deck_id, deck_name, model, data, media_files, audio_dirs):
-    deck = genanki.Deck(deck_id, deck_name)
+    pairs = [(entry["question_nep"], entry["answer_nep"]) for entry in data]
+    audio_files = tts.speak_pairs(tts.voice_for(VOICE), pairs, audio_dirs["question"], audio_dirs["answer"])
+    question_files = [question_file for question_file, _ in audio_files]
+    answer_files = [answer_file for _, answer_file in audio_files]
+    question_audio_paths = transcode_audio(audio_dirs["question"], question_files)
+    answer_audio_paths = transcode_audio(audio_dirs["answer"], answer_files)
 
-    for idx, entry in enumerate(data):
-        q_audio_file = f"question_{idx}.mp3"
-        a_audio_file = f"answer_{idx}.mp3"
-        
-        question_audio = generate_audio(entry["question_nep"], q_audio_file, audio_dirs["question"])
-        answer_audio = generate_audio(entry["answer_nep"], a_audio_file, audio_dirs["answer"])
+    for entry, question_file, answer_file in zip(data, question_files, answer_files):
+        # Hand-written transliterations, one line per text, win over romanize.py.
+        transliteration = entry["transliteration"].split("\n") if entry.get("transliteration") else []
+        question_audio = question_audio_paths.get(question_file)
+        answer_audio = answer_audio_paths.get(answer_file)
 
         note = genanki.Note(
             model=model,
             fields=[
                 entry["question_nep"],
-                entry["transliteration"].split("\n")[0],
+                transliteration[0] if len(transliteration) > 0 else romanize(entry["question_nep"], sentence=True),
                 entry["question_eng"],
                 entry["answer_nep"],
-                entry["transliteration"].split("\n")[1],
+                transliteration[1] if len(transliteration) > 1 else romanize(entry["answer_nep"], sentence=True),
                 entry["answer_eng"],
-                question_audio,
-                answer_audio,
+                f"[sound:{question_audio.name}]" if question_audio else "",
+                f"[sound:{answer_audio.name}]" if answer_audio else "",
             ],
+            guid=note_guid(deck_id, entry["question_nep"]),
         )
-        deck.add_note(note)
-
-        if question_audio:
-            media_files.append(str(audio_dirs["question"] / q_audio_file))
-        if answer_audio:
-            media_files.append(str(audio_dirs["answer"] / a_audio_file))
+        build.add_note(deck, note, media=[question_audio, answer_audio])
 
     return deck
 
-model = genanki.Model(
-    1607392319,
-    "Nepali Q&A Model",
-    fields=[
-        {"name": "QuestionNepali"},
-        {"name": "TransliterationQ"},
-        {"name": "QuestionEnglish"},
-        {"name": "AnswerNepali"},
-        {"name": "TransliterationAns"},
-        {"name": "AnswerEnglish"},
-        {"name": "QuestionAudio"},
-        {"name": "AnswerAudio"},
-    ],
-    templates=[
-        {
-            "name": "Q&A Format",
-            "qfmt": "{{QuestionNepali}}<br>{{TransliterationQ}}<br>{{QuestionEnglish}}<br><br>{{AnswerNepali}}<br>{{TransliterationAns}}<br>{{AnswerEnglish}}<br>{{AnswerAudio}} {{QuestionAudio}}",
-            "afmt": "{{FrontSide}}<hr id=\"answer\">{{AnswerNepali}}<br>{{TransliterationAns}}<br>{{AnswerEnglish}}<br>{{AnswerAudio}}",
-        },
-    ],
-    css=".card { font-size: 5vw; }",
-)
-
-media_files = []
-
-deck = create_deck(
-    deck_id=2059400112,
-    deck_name="Nepali Time, Weather, and Verbs",
-    model=model,
-    data=qa_data,
-    media_files=media_files,
-    audio_dirs={"question": question_audio_dir, "answer": answer_audio_dir},
-)
-
-package = genanki.Package(deck)
-package.media_files = media_files
-output_file = f"Nepali_Practice_Sentences.apkg"
-package.write_to_file(output_file)
-print(f"Deck created: {output_file}")
\ No newline at end of file
+def make_model():
+    import genanki
+
+    return genanki.Model(
+        1607392319,
+        "Nepali Q&A Model",
+        fields=[
+            {"name": "QuestionNepali"},
+            {"name": "TransliterationQ"},
+            {"name": "QuestionEnglish"},
+            {"name": "AnswerNepali"},
+            {"name": "TransliterationAns"},
+            {"name": "AnswerEnglish"},
+            {"name": "QuestionAudio"},
+            {"name": "AnswerAudio"},
+        ],
+        templates=[
+            {
+                "name": "Q&A Format",
+                "qfmt": "{{QuestionNepali}}<br>{{TransliterationQ}}<br>{{QuestionEnglish}}<br><br>{{AnswerNepali}}<br>{{TransliterationAns}}<br>{{AnswerEnglish}}<br>{{AnswerAudio}} {{QuestionAudio}}",
+                "afmt": "{{FrontSide}}<hr id=\"answer\">{{AnswerNepali}}<br>{{TransliterationAns}}<br>{{AnswerEnglish}}<br>{{AnswerAudio}}",
+            },
+        ],
+        css=".card { font-size: 5vw; }",
+    )
+
+def generate_sentences():
+    """Generate the audio and write the deck."""
+    from incremental_package import DeckBuild
+
+    build = DeckBuild()
+
+    deck = create_deck(
+        build,
+        deck_id=2059400112,
+        deck_name="Nepali Time, Weather, and Verbs",
+        model=make_model(),
+        data=qa_data,
+        audio_dirs={"question": question_audio_dir, "answer": answer_audio_dir},
+    )
+
+    output_file = f"Nepali_Practice_Sentences.apkg"
+    build.write_package(output_file)
+    print(f"Deck created: {output_file}")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    generate_sentences()
+    metrics.report()
@@ -0,0 +1,167 @@
+"""Shared, indexed access to processed_notes.json.
+
+Notes are kept in their original order in ``NoteStore.notes``. Hash indexes
+on the Nepali word, the English meaning and the media file names make
+existence checks and lookups O(1). Updates are checkpointed to an
+append-only journal next to the JSON file and compacted back into the
+regular format by ``save``.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+NOTES_FILE = Path(r"processed_notes.json")
+MEDIA_FIELDS = ('image', 'word_audio', 'sentence_audio')
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(notes_file=NOTES_FILE):
+    """Return the shared store for notes_file, loading it on first use."""
+    key = Path(notes_file).resolve()
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = NoteStore(notes_file)
+        return _stores[key]
+
+
+class NoteStore:
+    def __init__(self, notes_file=NOTES_FILE):
+        self.notes_file = Path(notes_file)
+        self.journal_file = self.notes_file.with_suffix('.jsonl')
+        self.notes = []
+        self._by_nepali = {}
+        self._positions = {}
+        self._by_english = {}
+        self._by_media = {}
+        self._journal = None
+        self._lock = threading.RLock()
+        self.load()
+
+    def __len__(self):
+        return len(self.notes)
+
+    def __iter__(self):
+        return iter(self.notes)
+
+    def __contains__(self, nepali_word):
+        return nepali_word in self._by_nepali
+
+    def load(self):
+        with self._lock:
+            self.notes = []
+            self._by_nepali.clear()
+            self._positions.clear()
+            self._by_english.clear()
+            self._by_media.clear()
+
+            if self.notes_file.exists():
+                with open(self.notes_file, 'r', encoding='utf-8') as file:
+                    for note in json.load(file):
+                        self._put(note)
+
+            # Replay notes checkpointed by a run that never reached save.
+            if self.journal_file.exists():
+                with open(self.journal_file, 'r', encoding='utf-8') as file:
+                    for line in file:
+                        try:
+                            note = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue  # torn write from a crash mid-append
+                        self._put(note)
+
+    def get(self, nepali_word):
+        return self._by_nepali.get(nepali_word)
+
+    def find_by_english(self, english):
+        return list(self._by_english.get(english.strip().lower(), ()))
+
+    def find_by_media(self, file_name):
+        return list(self._by_media.get(file_name, ()))
+
+    def next_index(self):
+        return len(self.notes) + 1
+
+    def upsert(self, note, checkpoint=True):
+        """Insert a note, or replace the stored note with the same Nepali word.
+
+        Replaced notes keep their position in the store. With checkpoint, the
+        note is durably appended to the journal before returning.
+        """
+        with self._lock:
+            self._put(note)
+            if checkpoint:
+                journal = self._open_journal()
+                journal.write(json.dumps(note, ensure_ascii=False) + '\n')
+                journal.flush()
+                os.fsync(journal.fileno())
+
+    def upsert_numbered(self, note, checkpoint=True):
+        """upsert() note with an index: the replaced note's, or the next free one.
+
+        The index is assigned and the note stored under the store's lock, so
+        writers sharing a store never hand out the same index. Returns the
+        stored note.
+        """
+        with self._lock:
+            old = self._by_nepali.get(note['nepali'])
+            note = {"index": old["index"] if old else self.next_index(), **{key: value for key, value in note.items() if key != "index"}}
+            self.upsert(note, checkpoint)
+            return note
+
+    def save(self):
+        """Compact the store into the JSON file and drop the journal."""
+        with self._lock:
+            self.close()
+            tmp_file = self.notes_file.with_name(self.notes_file.name + '.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as file:
+                json.dump(self.notes, file, ensure_ascii=False, indent=4)
+            os.replace(tmp_file, self.notes_file)
+            self.journal_file.unlink(missing_ok=True)
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _put(self, note):
+        old = self._by_nepali.get(note['nepali'])
+        if old is None:
+            self._positions[note['nepali']] = len(self.notes)
+            self.notes.append(note)
+        else:
+            self._unindex(old)
+            self.notes[self._positions[note['nepali']]] = note
+        self._index(note)
+
+    def _index(self, note):
+        self._by_nepali[note['nepali']] = note
+        english = note.get('english')
+        if english:
+            self._by_english.setdefault(english.strip().lower(), []).append(note)
+        for field in MEDIA_FIELDS:
+            if note.get(field):
+                self._by_media.setdefault(note[field], []).append(note)
+
+    def _unindex(self, note):
+        del self._by_nepali[note['nepali']]
+        english = note.get('english')
+        if english:
+            self._by_english[english.strip().lower()].remove(note)
+        for field in MEDIA_FIELDS:
+            if note.get(field):
+                self._by_media[note[field]].remove(note)
+
+    def _open_journal(self):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+            # Start on a fresh line if a previous run died halfway through a write.
+            if self.journal_file.stat().st_size > 0:
+                with open(self.journal_file, 'rb') as file:
+                    file.seek(-1, os.SEEK_END)
+                    if file.read(1) != b'\n':
+                        self._journal.write('\n')
+        return self._journal
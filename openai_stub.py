@@ -0,0 +1,84 @@
+"""Local stand-in for the OpenAI client used by the deck scripts.
+
+FakeOpenAI answers beta.chat.completions.parse with placeholder
+translations (one item per requested word for batch requests) and
+chat.completions.create with placeholder audio, after a configurable
+delay. It can inject retryable failures and reports token usage like the
+real client, so the pipeline can be run and benchmarked offline.
+"""
+import base64
+import hashlib
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from rate_limit import RetryableError
+from translation import BatchTranslationItem, BatchTranslationResponse, TranslationResponse
+
+
+def fake_fields(nepali_word):
+    return {
+        "english_meaning": f"meaning of {nepali_word}",
+        "nepali_sentence": f"यो <strong>{nepali_word}</strong> हो।",
+        "english_sentence": f"This is {nepali_word}.",
+    }
+
+
+def completion(model, message, prompt_text, completion_tokens):
+    usage = SimpleNamespace(prompt_tokens=len(prompt_text) // 4, completion_tokens=completion_tokens)
+    return SimpleNamespace(model=model, usage=usage, choices=[SimpleNamespace(index=0, message=message)])
+
+
+class FakeOpenAI:
+    def __init__(self, latency=0.5, latency_per_item=0.05, error_rate=0.0, audio_payload=b"ID3", audio_size=0, seed=0):
+        """latency is per request; latency_per_item is added per word in a batch.
+
+        Audio responses are audio_payload plus bytes unique to the text,
+        padded to audio_size.
+        """
+        self.latency = latency
+        self.latency_per_item = latency_per_item
+        self.error_rate = error_rate
+        self.audio_payload = audio_payload
+        self.audio_size = audio_size
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        completions = SimpleNamespace(parse=self.parse)
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _wait(self, items=1):
+        with self._lock:
+            fail = self._rng.random() < self.error_rate
+        time.sleep(self.latency + self.latency_per_item * items)
+        if fail:
+            raise RetryableError("injected failure", status_code=503)
+
+    def parse(self, model, messages, response_format, **kwargs):
+        prompt = messages[-1]["content"]
+        if response_format is BatchTranslationResponse:
+            words = [line[2:] for line in prompt.splitlines() if line.startswith("- ")]
+            self._wait(len(words))
+            parsed = BatchTranslationResponse(items=[
+                BatchTranslationItem(nepali_word=word, **fake_fields(word)) for word in words
+            ])
+        else:
+            word = re.search(r"'(.+?)'", prompt).group(1)
+            self._wait()
+            words = [word]
+            parsed = TranslationResponse(**fake_fields(word))
+        message = SimpleNamespace(role="assistant", content=parsed.model_dump_json(), parsed=parsed)
+        return completion(model, message, prompt, 60 * len(words))
+
+    def create(self, model, messages, **kwargs):
+        self._wait()
+        text = messages[-1]["content"]
+        # Distinct bytes per text, so the media cache does not collapse them.
+        tail = hashlib.sha256(text.encode('utf-8')).digest()
+        padding = max(0, self.audio_size - len(self.audio_payload) - len(tail))
+        data = self.audio_payload + tail + random.Random(tail).randbytes(padding)
+        audio = SimpleNamespace(id="audio_stub", data=base64.b64encode(data).decode('ascii'), transcript="")
+        message = SimpleNamespace(role="assistant", content=None, audio=audio)
+        return completion(model, message, text, len(data) // 40)
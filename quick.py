@@ -1,19 +1,13 @@
-import os 
 from pathlib import Path 
-import genanki 
 from dotenv import load_dotenv 
-from elevenlabs import ElevenLabs 
-
-load_dotenv() 
-ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY') 
-
-eleven_client = ElevenLabs(api_key=ELEVENLABS_API_KEY) 
+from romanize import romanize 
+import metrics 
+import tts 
+from audio_transcode import transcode_audio 
 
 base_audio_dir = Path(r"C:\anki_audio") 
 question_audio_dir = base_audio_dir / "questions" 
 answer_audio_dir = base_audio_dir / "answers" 
-question_audio_dir.mkdir(parents=True, exist_ok=True) 
-answer_audio_dir.mkdir(parents=True, exist_ok=True) 
 
 qa_data = [ 
     { 
@@ -82,102 +76,104 @@ qa_data = [
     }, 
 ] 
 
-def generate_audio(text, filename, directory): 
-    audio_path = directory / filename 
-    if audio_path.exists(): 
-        return f"[sound:{audio_path.name}]"   
-    try: 
-        audio_content = eleven_client.text_to_speech.convert( 
-            voice_id="XrExE9yKIg1WjnnlVkGX",   
-            output_format="mp3_44100_64", 
-            text=text, 
-            model_id="eleven_multilingual_v2", 
-        ) 
-        if hasattr(audio_content, "__iter__") and not isinstance(audio_content, (bytes, bytearray)): 
-            audio_content = b"".join(audio_content) 
+ELEVENLABS_VOICE_ID = "XrExE9yKIg1WjnnlVkGX" 
+ELEVENLABS_MODEL_ID = "eleven_multilingual_v2" 
+ELEVENLABS_OUTPUT_FORMAT = "mp3_44100_64" 
+
+# Keyed on the text itself, so reordering qa_data can never pair a 
+# question with another question's audio. 
+VOICE = tts.ElevenLabsVoice(ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, ELEVENLABS_OUTPUT_FORMAT) 
 
-        with open(audio_path, "wb") as f: 
-            f.write(audio_content) 
-        return f"[sound:{audio_path.name}]" 
-    except Exception as e: 
-        print(f"Error generating audio for '{text}': {e}") 
-        return ""  
+def create_deck(build, deck_id, deck_name, model, data, audio_dirs): 
+    import genanki 
+    from incremental_package import note_guid 
 
-def create_deck(deck_id, deck_name, model, data, media_files, audio_dirs): 
-    deck = genanki.Deck(deck_id, deck_name) 
+    deck = build.add_deck(deck_id, deck_name) 
 
-    for idx, entry in enumerate(data): 
-        q_audio_file = f"question_{idx}.mp3" 
-        a_audio_file = f"answer_{idx}.mp3" 
-        question_audio = generate_audio(entry["question_nep"], q_audio_file, audio_dirs["question"]) 
-        answer_audio = generate_audio(entry["answer_nep"], a_audio_file, audio_dirs["answer"]) 
+    pairs = [(entry["question_nep"], entry["answer_nep"]) for entry in data] 
+    audio_files = tts.speak_pairs(tts.voice_for(VOICE), pairs, audio_dirs["question"], audio_dirs["answer"]) 
+    question_files = [question_file for question_file, _ in audio_files] 
+    answer_files = [answer_file for _, answer_file in audio_files] 
+    question_audio_paths = transcode_audio(audio_dirs["question"], question_files) 
+    answer_audio_paths = transcode_audio(audio_dirs["answer"], answer_files) 
+
+    for entry, question_file, answer_file in zip(data, question_files, answer_files): 
+        question_audio = question_audio_paths.get(question_file) 
+        answer_audio = answer_audio_paths.get(answer_file) 
 
         note = genanki.Note( 
             model=model, 
             fields=[ 
                 entry["question_nep"], 
                 entry["answer_nep"], 
-                entry.get("transliteration_q", ""), 
+                entry.get("transliteration_q") or romanize(entry["question_nep"], sentence=True), 
                 entry["question_eng"], 
                 entry["answer_eng"], 
-                entry.get("transliteration_ans", ""), 
-                question_audio, 
-                answer_audio, 
+                entry.get("transliteration_ans") or romanize(entry["answer_nep"], sentence=True), 
+                f"[sound:{question_audio.name}]" if question_audio else "", 
+                f"[sound:{answer_audio.name}]" if answer_audio else "", 
             ], 
+            guid=note_guid(deck_id, entry["question_nep"]), 
         ) 
-        deck.add_note(note) 
-
-        if question_audio: 
-            media_files.append(str(audio_dirs["question"] / q_audio_file)) 
-        if answer_audio: 
-            media_files.append(str(audio_dirs["answer"] / a_audio_file)) 
+        build.add_note(deck, note, media=[question_audio, answer_audio]) 
 
     return deck 
 
 
-model = genanki.Model( 
-    1607392319, 
-    "Nepali Q&A Model with Transliteration", 
-    fields=[ 
-        {"name": "QuestionNepali"}, 
-        {"name": "AnswerNepali"}, 
-        {"name": "TransliterationQ"}, 
-        {"name": "QuestionEnglish"}, 
-        {"name": "AnswerEnglish"}, 
-        {"name": "TransliterationAns"}, 
-        {"name": "QuestionAudio"}, 
-        {"name": "AnswerAudio"}, 
-    ], 
-    templates=[ 
-        { 
-            "name": "Question and Transliteration", 
-            "qfmt": "{{QuestionNepali}}<br>{{TransliterationQ}}<br>{{QuestionAudio}}", 
-            "afmt": "{{QuestionEnglish}}<br>{{AnswerNepali}}<br>{{TransliterationAns}}<br>{{AnswerEnglish}}<br>{{AnswerAudio}}", 
-        }, 
-        { 
-            "name": "Q&A Format", 
-            "qfmt": "{{QuestionNepali}}<br>{{QuestionAudio}}", 
-            "afmt": "{{AnswerNepali}}<br>{{TransliterationAns}}<br>{{AnswerAudio}}", 
-        }, 
-    ], 
-) 
-
-media_files = [] 
-
-decks = [ 
-    create_deck( 
-        deck_id=2059400111, 
-        deck_name="Nepali Questions and Translations with Transliteration", 
-        model=model, 
-        data=qa_data, 
-        media_files=media_files, 
-        audio_dirs={"question": question_audio_dir, "answer": answer_audio_dir}, 
+def make_model(): 
+    import genanki 
+
+    return genanki.Model( 
+        1607392319, 
+        "Nepali Q&A Model with Transliteration", 
+        fields=[ 
+            {"name": "QuestionNepali"}, 
+            {"name": "AnswerNepali"}, 
+            {"name": "TransliterationQ"}, 
+            {"name": "QuestionEnglish"}, 
+            {"name": "AnswerEnglish"}, 
+            {"name": "TransliterationAns"}, 
+            {"name": "QuestionAudio"}, 
+            {"name": "AnswerAudio"}, 
+        ], 
+        templates=[ 
+            { 
+                "name": "Question and Transliteration", 
+                "qfmt": "{{QuestionNepali}}<br>{{TransliterationQ}}<br>{{QuestionAudio}}", 
+                "afmt": "{{QuestionEnglish}}<br>{{AnswerNepali}}<br>{{TransliterationAns}}<br>{{AnswerEnglish}}<br>{{AnswerAudio}}", 
+            }, 
+            { 
+                "name": "Q&A Format", 
+                "qfmt": "{{QuestionNepali}}<br>{{QuestionAudio}}", 
+                "afmt": "{{AnswerNepali}}<br>{{TransliterationAns}}<br>{{AnswerAudio}}", 
+            }, 
+        ], 
     ) 
-] 
 
-for deck in decks: 
-    package = genanki.Package(deck) 
-    package.media_files = media_files 
-    output_file = f"{deck.deck_id}.apkg" 
-    package.write_to_file(output_file) 
-    print(f"Deck created: {output_file}") 
\ No newline at end of file
+def generate_qa(): 
+    """Generate the audio and write the deck.""" 
+    from incremental_package import DeckBuild 
+
+    build = DeckBuild() 
+
+    decks = [ 
+        create_deck( 
+            build, 
+            deck_id=2059400111, 
+            deck_name="Nepali Questions and Translations with Transliteration", 
+            model=make_model(), 
+            data=qa_data, 
+            audio_dirs={"question": question_audio_dir, "answer": answer_audio_dir}, 
+        ) 
+    ] 
+
+    output_files = {deck.deck_id: f"{deck.deck_id}.apkg" for deck in decks} 
+    build.write_packages(output_files) 
+    for output_file in output_files.values(): 
+        print(f"Deck created: {output_file}") 
+
+
+if __name__ == "__main__": 
+    load_dotenv() 
+    generate_qa() 
+    metrics.report() 
@@ -0,0 +1,154 @@
+"""Per-provider rate limiting and retries for API calls.
+
+Every outgoing request goes through ``call(provider, fn, ...)``. Each
+provider has a token bucket shared by all threads, so concurrent workers
+together stay under the provider's limit. Transient failures (429, 5xx,
+timeouts, dropped connections) are retried with jittered exponential
+backoff, honouring Retry-After when the server sends one. A 429 also
+halves the provider's rate, which then creeps back up as requests succeed.
+
+Limits can be overridden per provider with RATE_LIMIT_<PROVIDER>, given as
+requests per second with an optional burst size, e.g. RATE_LIMIT_OPENAI=5:10.
+"""
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import metrics
+
+# (requests per second, burst size)
+DEFAULT_LIMITS = {
+    "openai": (5.0, 10),
+    "pixabay": (1.5, 5),  # the API allows 100 requests per minute
+    "pixabay_cdn": (20.0, 20),
+    "narakeet": (2.0, 4),
+    "elevenlabs": (2.0, 4),
+    "google": (10.0, 20),
+}
+FALLBACK_LIMIT = (2.0, 4)
+
+MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RetryableError(Exception):
+    """Raised by callers for failures that should be retried, e.g. a bad HTTP status."""
+
+    def __init__(self, message, status_code=None, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def throttle(self, pause=None):
+        """Back off after a 429: halve the rate and optionally pause everyone."""
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+            if pause:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+
+    def recover(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def get_limiter(provider):
+    with _limiters_lock:
+        if provider not in _limiters:
+            rate, burst = DEFAULT_LIMITS.get(provider, FALLBACK_LIMIT)
+            override = os.getenv(f"RATE_LIMIT_{provider.upper()}")
+            if override:
+                rate, _, burst_override = override.partition(":")
+                rate = float(rate)
+                burst = int(burst_override) if burst_override else max(1, int(rate))
+            _limiters[provider] = TokenBucket(rate, burst)
+        return _limiters[provider]
+
+
+def status_code(exc):
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code
+
+
+def is_retryable(exc):
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    name = type(exc).__name__
+    return isinstance(exc, RetryableError) or "Timeout" in name or "Connection" in name
+
+
+def retry_after(exc):
+    """Seconds the server asked us to wait, or None."""
+    headers = getattr(exc, "headers", None) or getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt):
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def call(provider, fn, *args, **kwargs):
+    """Call fn under provider's rate limit, retrying transient failures."""
+    limiter = get_limiter(provider)
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            with metrics.timer(f"api.{provider}"):
+                result = fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_retryable(e):
+                raise
+            metrics.count(f"retries.{provider}")
+            delay = retry_after(e)
+            if status_code(e) == 429:
+                limiter.throttle(delay)
+            time.sleep(delay if delay is not None else backoff(attempt))
+        else:
+            limiter.recover()
+            metrics.record_usage(provider, result)
+            return result
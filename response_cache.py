@@ -0,0 +1,121 @@
+"""Persistent cache of parsed LLM responses.
+
+Responses are stored in a SQLite file keyed by (model, prompt template
+hash, input), so re-running a deck, or building a new one that shares
+words with an old one, only pays for inputs the current model and prompt
+have not answered before. Changing the model, the prompt wording or the
+response schema changes the key, so stale answers are never reused.
+
+Entries can expire after RESPONSE_CACHE_TTL_DAYS, and the cache can be
+capped at RESPONSE_CACHE_MAX_ENTRIES, evicting the least recently used
+entries first. Both default to 0, meaning no limit.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+import metrics
+
+RESPONSE_CACHE_FILE = Path(os.getenv("RESPONSE_CACHE_FILE", "llm_cache.sqlite3"))
+RESPONSE_CACHE_TTL_DAYS = float(os.getenv("RESPONSE_CACHE_TTL_DAYS", "0"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "0"))
+EVICT_EVERY = 100
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def open_response_cache(path=RESPONSE_CACHE_FILE):
+    """Return the shared cache for path, creating the database on first use."""
+    key = Path(path).resolve()
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ResponseCache(path)
+        return _caches[key]
+
+
+def prompt_hash(*parts):
+    """Hash everything that shapes a response: prompts, instructions, schema."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def make_key(model, template_hash, text):
+    raw = '\0'.join([model, template_hash, unicodedata.normalize('NFC', text.strip())])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, ttl_days=RESPONSE_CACHE_TTL_DAYS, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                template_hash TEXT NOT NULL,
+                input TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._conn.commit()
+        self._puts = 0
+        with self._lock:
+            self._evict(time.time())
+            self._conn.commit()
+
+    def get(self, model, template_hash, text):
+        """Return the cached response for text as a dict, or None on a miss."""
+        key = make_key(model, template_hash, text)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                metrics.count("response_cache.miss")
+                return None
+            if self.max_entries:
+                self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+                self._conn.commit()
+            metrics.count("response_cache.hit")
+        return json.loads(row[0])
+
+    def put(self, model, template_hash, text, response):
+        """Store a response dict for text, evicting old entries if over the limit."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (make_key(model, template_hash, text), model, template_hash, text,
+                 json.dumps(response, ensure_ascii=False), now, now),
+            )
+            self._puts += 1
+            # Evicting scans the table, so only do it every so often.
+            if self._puts % EVICT_EVERY == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        if self.ttl:
+            self._conn.execute('DELETE FROM responses WHERE created < ?', (now - self.ttl,))
+        if self.max_entries:
+            self._conn.execute('''
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
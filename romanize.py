@@ -0,0 +1,342 @@
+"""Deterministic, offline romanization of Nepali (Devanagari) text.
+
+Three schemes are built from one table at import time:
+
+- ``iast``: the IAST transliteration (ā, ṭ, ś, ṃ, ...).
+- ``iso``: ISO 15919, which differs from IAST in a few letters (ē, ō, r̥, ṁ).
+- ``learner``: ASCII spelling of how Nepali is spoken ("aaphno", "chha",
+  "sh"), with long and short i/u merged as Nepali speech merges them.
+
+Conjuncts come out letter by letter through the virama, except for the
+clusters a scheme spells as a unit (क्ष, ज्ञ in the learner scheme). The
+strict schemes write every inherent vowel; the learner scheme drops it at
+the end of a word of two or more syllables, unless the word ends in a
+conjunct that keeps it (घर → ghar, हुन्छ → hunchha, रोल्यान्ड → rolyaand),
+before common postpositions and suffixes (रूपले → ruple, घरमा → gharmaa),
+and inside a word before a closed syllable (मनपर्छ → manparchha). This
+covers most Nepali words but is a heuristic, not a pronunciation
+dictionary; curated spellings (names, loanwords) should override it.
+
+Markup such as ``<strong>`` passes through untouched and does not split
+the word around it. Words are romanized through a cache, so romanizing
+the whole note store takes well under a second.
+"""
+import functools
+import os
+import re
+import unicodedata
+
+ROMANIZATION_SCHEME = os.getenv("ROMANIZATION_SCHEME", "learner")
+
+VIRAMA = '्'
+NUKTA = '़'
+ANUSVARA = 'ं'
+CANDRABINDU = 'ँ'
+VISARGA = 'ः'
+AVAGRAHA = 'ऽ'
+JOINERS = '‌‍'
+
+# Letter: (iast, iso, learner). ISO falls back to IAST where they agree.
+CONSONANTS = {
+    'क': ('k', None, 'k'), 'ख': ('kh', None, 'kh'), 'ग': ('g', None, 'g'), 'घ': ('gh', None, 'gh'), 'ङ': ('ṅ', None, 'ng'),
+    'च': ('c', None, 'ch'), 'छ': ('ch', None, 'chh'), 'ज': ('j', None, 'j'), 'झ': ('jh', None, 'jh'), 'ञ': ('ñ', None, 'n'),
+    'ट': ('ṭ', None, 't'), 'ठ': ('ṭh', None, 'th'), 'ड': ('ḍ', None, 'd'), 'ढ': ('ḍh', None, 'dh'), 'ण': ('ṇ', None, 'n'),
+    'त': ('t', None, 't'), 'थ': ('th', None, 'th'), 'द': ('d', None, 'd'), 'ध': ('dh', None, 'dh'), 'न': ('n', None, 'n'),
+    'प': ('p', None, 'p'), 'फ': ('ph', None, 'ph'), 'ब': ('b', None, 'b'), 'भ': ('bh', None, 'bh'), 'म': ('m', None, 'm'),
+    'य': ('y', None, 'y'), 'र': ('r', None, 'r'), 'ल': ('l', None, 'l'), 'व': ('v', None, 'v'),
+    'श': ('ś', None, 'sh'), 'ष': ('ṣ', None, 'sh'), 'स': ('s', None, 's'), 'ह': ('h', None, 'h'), 'ळ': ('ḻ', None, 'l'),
+    # With nukta.
+    'क़': ('q', None, 'q'), 'ख़': ('k͟h', None, 'kh'), 'ग़': ('ġ', None, 'g'), 'ज़': ('z', None, 'z'),
+    'ड़': ('ṛ', None, 'r'), 'ढ़': ('ṛh', None, 'rh'), 'फ़': ('f', None, 'f'), 'य़': ('ẏ', None, 'y'),
+}
+# Independent vowel: (matra, iast, iso, learner).
+VOWELS = {
+    'अ': (None, 'a', None, 'a'), 'आ': ('ा', 'ā', None, 'aa'), 'इ': ('ि', 'i', None, 'i'), 'ई': ('ी', 'ī', None, 'i'),
+    'उ': ('ु', 'u', None, 'u'), 'ऊ': ('ू', 'ū', None, 'u'), 'ऋ': ('ृ', 'ṛ', 'r̥', 'ri'), 'ॠ': ('ॄ', 'ṝ', 'r̥̄', 'ri'),
+    'ऌ': ('ॢ', 'ḷ', 'l̥', 'li'), 'ए': ('े', 'e', 'ē', 'e'), 'ऐ': ('ै', 'ai', None, 'ai'), 'ओ': ('ो', 'o', 'ō', 'o'),
+    'औ': ('ौ', 'au', None, 'au'), 'ऍ': ('ॅ', 'ê', None, 'e'), 'ऑ': ('ॉ', 'ô', None, 'o'),
+}
+# Sign: (iast, iso, learner). The learner anusvara depends on the next letter.
+SIGNS = {
+    ANUSVARA: ('ṃ', 'ṁ', 'n'), CANDRABINDU: ('m̐', None, 'n'), VISARGA: ('ḥ', None, 'h'), AVAGRAHA: ("'", None, ''),
+    'ॐ': ('oṃ', 'ōṁ', 'om'),
+}
+# Clusters a scheme spells as a unit; the last letter takes the vowel.
+CLUSTERS = {
+    'learner': {'क्ष': 'chhy', 'ज्ञ': 'gy'},
+}
+LABIALS = {'प', 'फ', 'ब', 'भ', 'म'}
+VELARS = {'क', 'ख', 'ग', 'घ'}
+
+# Word endings after which the learner scheme keeps the inherent vowel: the
+# verb ending छ, conjuncts ending in य, र or व (सत्य, मित्र, स्वत्व), doubled
+# consonants (चाहन्न) and the native conjuncts below. Other final conjuncts,
+# mostly in loanwords, lose it (रोल्यान्ड → rolyaand, टेस्ट → test).
+SCHWA_KEEPING_LAST = {'य', 'र', 'व'}
+SCHWA_KEEPING_CLUSTERS = {
+    'न्त', 'न्द', 'न्ध', 'न्ह', 'म्ब', 'म्भ', 'ङ्क', 'ङ्ग', 'ञ्च', 'ञ्ज', 'ण्ड', 'ण्ठ',
+    'ष्ट', 'ष्ठ', 'ष्ण', 'स्त', 'स्थ', 'क्त', 'क्ष', 'ज्ञ', 'द्ध', 'ब्ध', 'ब्द', 'ग्ध', 'प्त', 'श्च', 'ह्म',
+    'र्क', 'र्ग', 'र्च', 'र्ण', 'र्त', 'र्थ', 'र्द', 'र्ध', 'र्म', 'र्ष', 'र्श', 'र्स',
+}
+PUNCTUATION = {'।': '.', '॥': '.', '॰': '.', **{chr(0x0966 + digit): str(digit) for digit in range(10)}}
+
+# Postpositions and suffixes written joined to the word before them. The
+# inherent vowel before them is dropped as it would be at the end of a word.
+SUFFIXES = sorted([
+    'ले', 'लाई', 'को', 'का', 'की', 'मा', 'बाट', 'देखि', 'सम्म', 'सँग', 'सित', 'भन्दा', 'तिर', 'हरू', 'हरु',
+    'मै', 'नै', 'पनि', 'भित्र', 'बाहिर', 'माथि', 'तल', 'जस्तो', 'वाला',
+], key=len, reverse=True)
+
+SCHEMES = ('iast', 'iso', 'learner')
+SCHWA_DELETION = {'iast': False, 'iso': False, 'learner': True}
+
+
+def build_tables():
+    """Precompute {scheme: {letter: romanization}} for every table."""
+    tables = {}
+    for position, scheme in enumerate(SCHEMES):
+        def pick(values, offset=0):
+            iast, iso, learner = values[offset:offset + 3]
+            return (iast, iso or iast, learner)[position]
+
+        tables[scheme] = {
+            "consonants": {letter: pick(values) for letter, values in CONSONANTS.items()},
+            "vowels": {letter: pick(values, 1) for letter, values in VOWELS.items()},
+            "matras": {values[0]: pick(values, 1) for values in VOWELS.values() if values[0]},
+            "signs": {sign: pick(values) for sign, values in SIGNS.items()},
+            "clusters": CLUSTERS.get(scheme, {}),
+        }
+    return tables
+
+
+TABLES = build_tables()
+MATRA_CHARS = {values[0] for values in VOWELS.values() if values[0]}
+# Runs of Devanagari letters, with any markup inside them; digits and
+# dandas are left out and mapped through PUNCTUATION.
+WORD = re.compile(r'(?:<[^>]*>|[ऀ-ॣ॰-ॿ‌‍])+')
+TAG = re.compile(r'(<[^>]*>)')
+
+
+def romanize(text, scheme=ROMANIZATION_SCHEME, sentence=False):
+    """Romanize the Devanagari in text, leaving markup and other text as is.
+
+    With sentence, the first letter is capitalized.
+    """
+    if scheme not in TABLES:
+        raise ValueError(f"Unknown romanization scheme: {scheme}")
+    # NFC splits precomposed nukta letters (क़) into letter + nukta.
+    text = unicodedata.normalize('NFC', text)
+    result = WORD.sub(lambda match: romanize_word(match.group(0), scheme), text)
+    result = ''.join(PUNCTUATION.get(char, char) for char in result)
+    if sentence:
+        result = capitalize(result)
+    return result
+
+
+def capitalize(text):
+    """Capitalize the first letter outside markup."""
+    parts = TAG.split(text)
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            for j, char in enumerate(part):
+                if char.isalpha():
+                    parts[i] = part[:j] + char.upper() + part[j + 1:]
+                    return ''.join(parts)
+    return text
+
+
+@functools.lru_cache(maxsize=65536)
+def romanize_word(word, scheme):
+    """Romanize one word, which may contain markup."""
+    parts = TAG.split(word)
+    letters = ''.join(parts[0::2])
+    romanized = romanize_letters(letters, scheme)
+    # Put the markup back at the same letter offsets.
+    output = []
+    position = 0
+    for i, part in enumerate(parts):
+        if i % 2:
+            output.append(part)
+        else:
+            output.append(''.join(romanized[position:position + len(part)]))
+            position += len(part)
+    return ''.join(output)
+
+
+def romanize_letters(letters, scheme):
+    """Return one string per character of letters (many are empty)."""
+    table = TABLES[scheme]
+    out = [''] * len(letters)
+    # One entry per syllable, in order: its start, its consonants, the
+    # position carrying its inherent vowel (or None), whether it has a
+    # vowel at all and whether a nasal sign or visarga follows it.
+    syllables = []
+    onset = []
+    onset_start = None
+    i = 0
+    while i < len(letters):
+        char = letters[i]
+        cluster = next((c for c in table["clusters"] if letters.startswith(c, i)), None)
+        with_nukta = letters[i:i + 2] if letters[i + 1:i + 2] == NUKTA else None
+        if cluster or char in table["consonants"]:
+            if cluster:
+                out[i] = table["clusters"][cluster]
+                end = i + len(cluster)
+            elif with_nukta in table["consonants"]:
+                out[i] = table["consonants"][with_nukta]
+                end = i + 2
+            else:
+                out[i] = table["consonants"][char]
+                end = i + 1
+            if end < len(letters) and letters[end] == NUKTA:
+                end += 1
+            if onset_start is None:
+                onset_start = i
+            onset.extend(cluster.split(VIRAMA) if cluster else [char])
+            following = letters[end] if end < len(letters) else ''
+            if following == VIRAMA:
+                # ङ is spoken as n before another velar (अङ्ग्रेजी → angreji).
+                if scheme == 'learner' and char == 'ङ' and letters[end + 1:end + 2] in VELARS:
+                    out[i] = 'n'
+                i = end + 1
+                continue
+            if following in MATRA_CHARS:
+                out[end] = table["matras"][following]
+                syllables.append({"start": onset_start, "consonants": onset, "schwa": None, "vowel": True, "sign": False})
+                i = end + 1
+            else:
+                out[i] += 'a'
+                syllables.append({"start": onset_start, "consonants": onset, "schwa": i, "vowel": True, "sign": False})
+                i = end
+            onset, onset_start = [], None
+            continue
+
+        if onset:
+            # A consonant left with its virama closes the syllable before it.
+            syllables.append({"start": onset_start, "consonants": onset, "schwa": None, "vowel": False, "sign": False})
+            onset, onset_start = [], None
+        if char in table["vowels"]:
+            out[i] = table["vowels"][char]
+            syllables.append({"start": i, "consonants": [], "schwa": None, "vowel": True, "sign": False})
+        elif char == ANUSVARA and scheme == 'learner':
+            following = letters[i + 1] if i + 1 < len(letters) else ''
+            out[i] = 'm' if following in LABIALS else 'n'
+        elif char in table["signs"]:
+            out[i] = table["signs"][char]
+        elif char in JOINERS or char == NUKTA:
+            pass
+        else:
+            out[i] = char
+        if char in (ANUSVARA, CANDRABINDU, VISARGA) and syllables:
+            syllables[-1]["sign"] = True
+        i += 1
+    if onset:
+        syllables.append({"start": onset_start, "consonants": onset, "schwa": None, "vowel": False, "sign": False})
+
+    if SCHWA_DELETION[scheme]:
+        drop_schwas(letters, out, syllables)
+    return out
+
+
+def keeps_final_schwa(consonants):
+    """Whether a word ending in consonants (one syllable's onset) keeps its inherent vowel."""
+    if consonants[-1] == 'छ':
+        return True
+    if len(consonants) < 2:
+        return False
+    last_two = consonants[-2:]
+    return (
+        last_two[1] in SCHWA_KEEPING_LAST or last_two[0] == last_two[1]
+        or VIRAMA.join(last_two) in SCHWA_KEEPING_CLUSTERS
+    )
+
+
+def drop_schwas(letters, out, syllables):
+    """Drop the inherent vowels the learner scheme does not pronounce.
+
+    At the end of the word and before a joined suffix, the inherent vowel
+    of a word of two or more syllables is dropped, unless the word ends in
+    a conjunct that keeps it (हुन्छ, मित्र, अन्त). Then, from right to left,
+    the inherent vowel of a single consonant between a vowel and a closed
+    syllable is dropped (मनपर्छ → manparchha, सरकार → sarkaar), which leaves
+    open syllables alone (जनता → janataa).
+    """
+    def drop(syllable):
+        out[syllable["schwa"]] = out[syllable["schwa"]][:-1]
+        syllable["vowel"] = False
+
+    ends = [len(letters)]
+    for suffix in SUFFIXES:
+        if letters.endswith(suffix) and len(letters) > len(suffix):
+            ends.append(len(letters) - len(suffix))
+            break
+    for end in ends:
+        before = [syllable for syllable in syllables if syllable["start"] < end]
+        if len(before) < 2:
+            continue
+        last = before[-1]
+        if last["schwa"] is None or last["sign"] or keeps_final_schwa(last["consonants"]):
+            continue
+        drop(last)
+
+    for n in range(len(syllables) - 2, 0, -1):
+        syllable, previous, following = syllables[n], syllables[n - 1], syllables[n + 1]
+        if syllable["schwa"] is None or syllable["sign"] or len(syllable["consonants"]) != 1:
+            continue
+        if not previous["vowel"] or previous["sign"]:
+            continue
+        if len(following["consonants"]) != 1 or not following["vowel"] or following["sign"]:
+            continue
+        after = syllables[n + 2] if n + 2 < len(syllables) else None
+        if after is None or after["vowel"] and len(after["consonants"]) < 2:
+            continue  # the next syllable is open
+        drop(syllable)
+
+
+# Regression cases for the learner scheme's schwa rules, checked by
+# `python cli.py romanize --check`. Add a word here whenever a rule changes.
+EXAMPLES = [
+    ('घर', 'ghar'),
+    ('घरमा', 'gharmaa'),
+    ('रूपले', 'ruple'),
+    ('हुन्छ', 'hunchha'),
+    ('आउँछ', 'aaunchha'),
+    ('मित्र', 'mitra'),
+    ('अन्त', 'anta'),
+    ('सत्य', 'satya'),
+    ('धर्म', 'dharma'),
+    ('चाहन्न', 'chaahanna'),
+    ('नमस्ते', 'namaste'),
+    ('जनता', 'janataa'),
+    ('कमला', 'kamalaa'),
+    ('सरकार', 'sarkaar'),
+    ('मनपर्छ', 'manparchha'),
+    ('मिटबल्स', 'mitbals'),
+    ('रोल्यान्ड', 'rolyaand'),
+    ('टेस्ट', 'test'),
+    ('अङ्ग्रेजी', 'angreji'),
+    ('क्षमा', 'chhyamaa'),
+    ('तपाईं', 'tapaain'),
+]
+
+
+def check_examples(scheme='learner'):
+    """Return (word, expected, got) for every regression case scheme gets wrong."""
+    return [
+        (word, expected, romanize(word, scheme))
+        for word, expected in EXAMPLES
+        if romanize(word, scheme) != expected
+    ]
+
+
+def romanize_store(store, scheme=ROMANIZATION_SCHEME):
+    """Re-romanize every note in store with scheme, in place; return how many changed."""
+    changed = 0
+    for note in list(store.notes):
+        romanized = romanize(note["nepali"], scheme)
+        romanized_sentence = romanize(note["sentence"], scheme, sentence=True) if note.get("sentence") else note.get("romanized_sentence", '')
+        if (romanized, romanized_sentence) != (note.get("romanized"), note.get("romanized_sentence")):
+            store.upsert({**note, "romanized": romanized, "romanized_sentence": romanized_sentence}, checkpoint=False)
+            changed += 1
+    store.save()
+    return changed
@@ -0,0 +1,39 @@
+"""Local stand-in for the Google Translate v2 client.
+
+FakeTranslateClient answers translate() like google.cloud.translate_v2's
+Client, for a single string or a list, with placeholder translations. It
+can add latency and inject failures, so translate_words.py can be run
+without credentials:
+
+    python translate_words.py --fake --fake-error-rate 0.1
+"""
+import random
+import threading
+import time
+
+from rate_limit import RetryableError
+
+
+class FakeTranslateClient:
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def translate(self, values, target_language=None, source_language=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise RetryableError("injected failure", status_code=503)
+
+        single = isinstance(values, str)
+        results = [
+            {"translatedText": f"{target_language or 'en'}:{value}", "input": value}
+            for value in ([values] if single else values)
+        ]
+        return results[0] if single else results
@@ -1,30 +1,94 @@
-from google.cloud import translate_v2 as translate
+import argparse
 import os
-
-os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = r"C:\Users\rvand\Downloads\anki-translation-442303-7b1c82eb3428.json"
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import rate_limit
+from clients import get_client
+from word_lists import read_lines
 
 
 input_file = '1000-most-common-nepali-words.txt'
-output_file = '1000-most-common-nepali-words-translated.txt'  
+output_file = '1000-most-common-nepali-words-translated.txt'
+
+# Words per request (the v2 API accepts up to 128) and requests in flight.
+CHUNK_SIZE = int(os.getenv("TRANSLATE_CHUNK_SIZE", "100"))
+CONCURRENCY = int(os.getenv("TRANSLATE_CONCURRENCY", "4"))
+
+def completed_lines(output_path):
+    """Count the finished lines of a previous run and drop a torn last line."""
+    if not os.path.exists(output_path):
+        return 0
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        f.truncate(end)
+    return data.count(b'\n', 0, end)
+
+def translate_chunk(translate_client, words):
+    """Translate a chunk of lines, passing blank lines through untranslated."""
+    to_translate = [word for word in words if word]
+    if not to_translate:
+        return words
+    results = rate_limit.call('google', translate_client.translate, to_translate, source_language='ne', target_language='en')
+    translated = iter(result['translatedText'] for result in results)
+    return [next(translated) if word else '' for word in words]
 
-def translate_words(input_path, output_path):
+def translate_words(input_path, output_path, translate_client=None, chunk_size=CHUNK_SIZE, concurrency=CONCURRENCY):
+    """Translate input_path line by line into output_path, resuming a partial run.
+
+    Chunks are translated concurrently and written in input order as soon as
+    they finish, one line per input line, so an interrupted run keeps what it
+    has and the next run carries on after the last complete line.
+    """
     try:
-        translate_client = translate.Client()
+        if translate_client is None:
+            translate_client = get_client("google")
+
+        done = completed_lines(output_path)
+        if done:
+            print(f"Resuming after {done} translated lines")
+        lines = (word for _, word in islice(read_lines(input_path), done, None))
+        chunks = iter(lambda: list(islice(lines, chunk_size)), [])
 
-        with open(input_path, 'r', encoding='utf-8') as infile:
-            nepali_words = [line.strip() for line in infile.readlines()]
+        written = 0
+        with open(output_path, 'a', encoding='utf-8') as outfile, \
+             ThreadPoolExecutor(max_workers=concurrency) as executor:
+            in_flight = deque()
 
-        translated_words = []
-        for word in nepali_words:
-            result = translate_client.translate(word, source_language='ne', target_language='en')
-            translated_word = result['translatedText']
-            translated_words.append(translated_word)
+            def write_next():
+                nonlocal written
+                translated_words = in_flight.popleft().result()
+                outfile.write(''.join(word + '\n' for word in translated_words))
+                outfile.flush()
+                written += len(translated_words)
 
-        with open(output_path, 'w', encoding='utf-8') as outfile:
-            outfile.write('\n'.join(translated_words))
-        print(f"Translated words saved to {output_path}")
+            try:
+                for chunk in chunks:
+                    in_flight.append(executor.submit(translate_chunk, translate_client, chunk))
+                    if len(in_flight) > concurrency:
+                        write_next()
+                while in_flight:
+                    write_next()
+            finally:
+                for future in in_flight:
+                    future.cancel()
+        print(f"Translated {written} lines; saved to {output_path}")
 
     except Exception as e:
         print(f"Error during translation: {e}")
+        print("Run again to resume from the last complete line.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Translate a Nepali word list to English, one line per word.")
+    parser.add_argument("--input", default=input_file)
+    parser.add_argument("--output", default=output_file)
+    parser.add_argument("--fake", action="store_true", help="use the local fake client from translate_stub.py")
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
 
-translate_words(input_file, output_file)
+    client = None
+    if args.fake:
+        from translate_stub import FakeTranslateClient
+        client = FakeTranslateClient(latency=0.05, error_rate=args.fake_error_rate)
+    translate_words(args.input, args.output, client)
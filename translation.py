@@ -0,0 +1,159 @@
+"""Structured-output translation requests for Nepali words.
+
+Holds the response schemas and prompts shared by the interactive pipeline
+in gen_cards.py and the offline batch jobs in batch_jobs.py, so both ask
+the model exactly the same question. Parsed answers are kept in the
+response cache, so a word is only sent once per model and prompt.
+"""
+from pydantic import BaseModel, ValidationError
+
+import rate_limit
+from response_cache import open_response_cache, prompt_hash
+
+TRANSLATION_MODEL = "gpt-4o-2024-08-06"
+TRANSLATION_SYSTEM_PROMPT = "You are a language expert. Extract structured information about the Nepali word provided."
+# Romanization is done locally by romanize.py, so the model is not asked for it.
+TRANSLATION_INSTRUCTIONS = (
+    "1. Its meaning in English.\n"
+    "2. A simple sample sentence in Nepali where the word is used, "
+    "with the word <strong></strong>.\n"
+    "3. Translate the Nepali sentence into English, preserving the meaning."
+)
+
+
+class TranslationResponse(BaseModel):
+    english_meaning: str
+    nepali_sentence: str
+    english_sentence: str
+
+
+# Single-word and batch requests share the instructions and schema, so
+# their answers are cached under the same key.
+TRANSLATION_PROMPT_HASH = prompt_hash(
+    TRANSLATION_SYSTEM_PROMPT, TRANSLATION_INSTRUCTIONS, TranslationResponse.model_json_schema()
+)
+
+# Stamped on every generated note, so notes answered by an older model or
+# prompt can be found and regenerated.
+TRANSLATION_VERSION = {"model": TRANSLATION_MODEL, "prompt": TRANSLATION_PROMPT_HASH[:16]}
+
+
+class BatchTranslationItem(TranslationResponse):
+    nepali_word: str
+
+
+class BatchTranslationResponse(BaseModel):
+    items: list[BatchTranslationItem]
+
+
+def translation_messages(nepali_word):
+    return [
+        {
+            "role": "system",
+            "content": TRANSLATION_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"For the Nepali word '{nepali_word}', provide:\n" + TRANSLATION_INSTRUCTIONS
+        },
+    ]
+
+
+def batch_translation_messages(nepali_words):
+    word_list = "\n".join(f"- {nepali_word}" for nepali_word in nepali_words)
+    return [
+        {
+            "role": "system",
+            "content": "You are a language expert. Extract structured information about each Nepali word provided."
+        },
+        {
+            "role": "user",
+            "content": (
+                "For each of the following Nepali words, provide:\n" + TRANSLATION_INSTRUCTIONS + "\n"
+                "Return one item per word, with nepali_word set to the word exactly as given.\n\n"
+                + word_list
+            )
+        },
+    ]
+
+
+def response_format(model_class):
+    """JSON-schema response_format for raw (non-SDK) request bodies."""
+    schema = model_class.model_json_schema()
+    schema["additionalProperties"] = False
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model_class.__name__, "strict": True, "schema": schema},
+    }
+
+
+def cached_translation(nepali_word):
+    """Return the cached TranslationResponse for nepali_word, or None."""
+    value = open_response_cache().get(TRANSLATION_MODEL, TRANSLATION_PROMPT_HASH, nepali_word)
+    if value is None:
+        return None
+    try:
+        return TranslationResponse(**value)
+    except ValidationError:
+        return None
+
+
+def remember_translation(nepali_word, parsed):
+    open_response_cache().put(TRANSLATION_MODEL, TRANSLATION_PROMPT_HASH, nepali_word, parsed.model_dump())
+
+
+def translate_word(client, nepali_word):
+    cached = cached_translation(nepali_word)
+    if cached is not None:
+        return cached
+    response = rate_limit.call(
+        "openai",
+        client.beta.chat.completions.parse,
+        model=TRANSLATION_MODEL,
+        messages=translation_messages(nepali_word),
+        response_format=TranslationResponse
+    )
+    parsed = response.choices[0].message.parsed
+    remember_translation(nepali_word, parsed)
+    return parsed
+
+
+def translate_batch(client, nepali_words):
+    """Translate several words in one request.
+
+    Returns a dict of word -> TranslationResponse. Words the batch response
+    dropped or returned malformed are retried one at a time; words that
+    still fail are left out.
+    """
+    translated = {}
+    for nepali_word in nepali_words:
+        cached = cached_translation(nepali_word)
+        if cached is not None:
+            translated[nepali_word] = cached
+    uncached = [nepali_word for nepali_word in nepali_words if nepali_word not in translated]
+
+    if len(uncached) > 1:
+        try:
+            response = rate_limit.call(
+                "openai",
+                client.beta.chat.completions.parse,
+                model=TRANSLATION_MODEL,
+                messages=batch_translation_messages(uncached),
+                response_format=BatchTranslationResponse
+            )
+            requested = set(uncached)
+            for item in response.choices[0].message.parsed.items:
+                fields = item.model_dump(exclude={"nepali_word"})
+                if item.nepali_word in requested and item.nepali_word not in translated and all(v.strip() for v in fields.values()):
+                    translated[item.nepali_word] = TranslationResponse(**fields)
+                    remember_translation(item.nepali_word, translated[item.nepali_word])
+        except Exception as e:
+            print(f"Error translating batch starting at {uncached[0]}: {e}")
+
+    for nepali_word in uncached:
+        if nepali_word not in translated:
+            try:
+                translated[nepali_word] = translate_word(client, nepali_word)
+            except Exception as e:
+                print(f"Error generating for {nepali_word}: {e}")
+    return translated
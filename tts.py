@@ -0,0 +1,343 @@
+"""Text-to-speech providers shared by the deck scripts.
+
+Every provider is a voice object with the same shape: ``provider`` (the
+name used for rate limits, concurrency and the media cache), ``cache_voice``
+(what identifies the voice in the cache key), ``extension``, and
+``synthesize(text, audio_cache)``, which returns the audio bytes, a
+finished ``audio_cache.temp_path()`` file, or None.
+
+- OpenAIVoice: gpt-4o-audio-preview.
+- NarakeetVoice: the Narakeet text-to-speech API.
+- ElevenLabsVoice: ElevenLabs multilingual voices.
+- LocalVoice: a local engine run as a subprocess (espeak-ng by default, or
+  Piper or anything else that reads text on stdin and writes a wav file),
+  for fast offline drafts and CI.
+
+``speak`` and ``speak_all`` go through the media cache, so each text is
+only synthesized once per voice. With TTS_PAIR=1 (or ``cli.py
+--pair-audio``), ``speak_pair`` asks for both texts of a note in one
+synthesis, with a pause between them, and splits the clip at the pause
+(see audio_split.py); voices without ``synthesize_pair``, missing ffmpeg
+or an ambiguous pause fall back to one synthesis per text. Either way the
+parts are cached under the same keys as separate clips. Each provider runs at most
+TTS_CONCURRENCY_<PROVIDER> syntheses at a time. Setting TTS_PROVIDER (or
+``cli.py --tts``) swaps every script's voice for that provider's default
+voice, e.g. TTS_PROVIDER=local to build whole decks without network
+calls; drafts are cached under their own key, so a final build with the
+paid voice never reuses them.
+"""
+import base64
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import audio_split
+import http_pool
+import metrics
+import rate_limit
+from clients import get_client
+from media_cache import open_cache
+
+OPENAI_AUDIO_MODEL = "gpt-4o-audio-preview"
+OPENAI_AUDIO_VOICE = "alloy"
+OPENAI_AUDIO_PROMPT = (
+    "You are an expert Nepali speaker. Your task is to pronounce exactly and clearly the text provided, "
+    "without adding or modifying anything. Do not include greetings, explanations, or additional sounds."
+)
+# The prompt is part of the cache key, so rewording it re-synthesizes.
+OPENAI_AUDIO_CACHE_VOICE = f"{OPENAI_AUDIO_MODEL}/{OPENAI_AUDIO_VOICE}/{OPENAI_AUDIO_PROMPT}"
+
+OPENAI_AUDIO_PAIR_PROMPT = (
+    f" The text has two parts on separate lines. Pronounce the first part, stay silent for "
+    f"{audio_split.PAIR_PAUSE_SECONDS} seconds, then pronounce the second part."
+)
+# Narakeet and ElevenLabs both take an SSML break inside plain text.
+PAIR_BREAK = f'<break time="{audio_split.PAIR_PAUSE_SECONDS}s"/>'
+
+# Overridable so benchmarks can point it at a local stub server.
+NARAKEET_API_URL = os.getenv("NARAKEET_API_URL", "https://api.narakeet.com")
+
+# Read the text on stdin and write a wav file to {output}. For Piper, e.g.
+# TTS_LOCAL_COMMAND="piper --model ne_NP-google-medium.onnx --output_file {output}".
+TTS_LOCAL_COMMAND = os.getenv("TTS_LOCAL_COMMAND", "espeak-ng -v ne --stdin -w {output}")
+
+# Set to a provider name to use its default voice everywhere.
+TTS_PROVIDER = os.getenv("TTS_PROVIDER", "")
+
+# Set to 1 to speak both texts of a note with one synthesis.
+TTS_PAIR = os.getenv("TTS_PAIR", "0") == "1"
+
+DEFAULT_CONCURRENCY = {
+    "openai": 8,
+    "narakeet": 4,
+    "elevenlabs": 4,
+    "local": os.cpu_count() or 4,
+}
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def clean_text(text):
+    return re.sub(r'<.*?>', '', text)
+
+
+def concurrency(provider):
+    """How many syntheses provider may run at once (TTS_CONCURRENCY_<PROVIDER>)."""
+    return int(os.getenv(f"TTS_CONCURRENCY_{provider.upper()}", DEFAULT_CONCURRENCY.get(provider, 4)))
+
+
+def provider_slot(provider):
+    with _semaphores_lock:
+        if provider not in _semaphores:
+            _semaphores[provider] = threading.BoundedSemaphore(concurrency(provider))
+        return _semaphores[provider]
+
+
+def openai_audio_request(text, system_prompt=OPENAI_AUDIO_PROMPT, user_prefix=''):
+    """Keyword arguments for chat.completions.create that speak text."""
+    messages = []
+    if system_prompt:
+        messages.append({
+            "role": "system",
+            "content": system_prompt
+        })
+    messages.append({
+        "role": "user",
+        "content": f"{user_prefix}{clean_text(text)}"
+    })
+    return dict(
+        model=OPENAI_AUDIO_MODEL,
+        modalities=["text", "audio"],
+        audio={"voice": OPENAI_AUDIO_VOICE, "format": "mp3"},
+        messages=messages,
+    )
+
+
+class OpenAIVoice:
+    provider = "openai"
+    extension = ".mp3"
+
+    def __init__(self, system_prompt=OPENAI_AUDIO_PROMPT, user_prefix=''):
+        self.system_prompt = system_prompt
+        self.user_prefix = user_prefix
+        self.cache_voice = f"{OPENAI_AUDIO_MODEL}/{OPENAI_AUDIO_VOICE}/{system_prompt or user_prefix.strip()}"
+
+    def synthesize(self, text, audio_cache):
+        request = openai_audio_request(text, self.system_prompt, self.user_prefix)
+        completion = rate_limit.call("openai", get_client("openai").chat.completions.create, **request)
+        return base64.b64decode(completion.choices[0].message.audio.data)
+
+    def synthesize_pair(self, first, second, audio_cache):
+        system_prompt = (self.system_prompt or '') + OPENAI_AUDIO_PAIR_PROMPT
+        request = openai_audio_request(f"{first}\n{second}", system_prompt.strip(), self.user_prefix)
+        completion = rate_limit.call("openai", get_client("openai").chat.completions.create, **request)
+        return base64.b64decode(completion.choices[0].message.audio.data)
+
+
+class NarakeetVoice:
+    provider = "narakeet"
+    extension = ".m4a"
+
+    def __init__(self, voice="lhakpa"):
+        self.cache_voice = voice
+
+    def synthesize(self, text, audio_cache):
+        def post():
+            url = f"{NARAKEET_API_URL}/text-to-speech/m4a?voice={self.cache_voice}"
+            headers = {
+                'Accept': 'application/octet-stream',
+                'Content-Type': 'text/plain',
+                'x-api-key': os.getenv('NARAKEET_API_KEY'),
+            }
+            response = http_pool.get_session().post(url, headers=headers, data=text.encode('utf-8'), stream=True, timeout=http_pool.TIMEOUT)
+            if response.status_code in rate_limit.RETRYABLE_STATUS:
+                raise rate_limit.RetryableError(f"{response.status_code} - {response.text}", response.status_code, response.headers)
+            return response
+
+        response = rate_limit.call("narakeet", post)
+        if response.status_code != 200:
+            print(f"Error fetching audio: {response.status_code} - {response.text}")
+            return None
+        return http_pool.write_stream(response, audio_cache.temp_path())
+
+    def synthesize_pair(self, first, second, audio_cache):
+        return self.synthesize(f"{first} {PAIR_BREAK} {second}", audio_cache)
+
+
+class ElevenLabsVoice:
+    provider = "elevenlabs"
+    extension = ".mp3"
+
+    def __init__(self, voice_id="XrExE9yKIg1WjnnlVkGX", model_id="eleven_multilingual_v2", output_format="mp3_44100_64"):
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.output_format = output_format
+        self.cache_voice = f"{voice_id}/{model_id}/{output_format}"
+
+    def synthesize(self, text, audio_cache):
+        def convert():
+            audio_content = get_client("elevenlabs").text_to_speech.convert(
+                voice_id=self.voice_id,
+                output_format=self.output_format,
+                text=text,
+                model_id=self.model_id,
+            )
+            if hasattr(audio_content, "__iter__") and not isinstance(audio_content, (bytes, bytearray)):
+                audio_content = b"".join(audio_content)
+            return audio_content
+
+        # The audio streams in while it is joined, so retry the whole synthesis.
+        return rate_limit.call("elevenlabs", convert)
+
+    def synthesize_pair(self, first, second, audio_cache):
+        return self.synthesize(f"{first} {PAIR_BREAK} {second}", audio_cache)
+
+
+def command_args(command):
+    """Split a command string into arguments, keeping the backslashes of Windows paths."""
+    if not isinstance(command, str):
+        return list(command)
+    if os.name != "nt":
+        return shlex.split(command)
+    # Non-POSIX splitting leaves backslashes alone but keeps the quotes.
+    return [arg[1:-1] if len(arg) > 1 and arg[0] == arg[-1] == '"' else arg for arg in shlex.split(command, posix=False)]
+
+
+class LocalVoice:
+    provider = "local"
+    extension = ".wav"
+
+    def __init__(self, command=TTS_LOCAL_COMMAND):
+        """command is a string, split as the platform's shell would, or a list of arguments."""
+        self.args = command_args(command)
+        # The command names the engine, voice and model, so changing it re-synthesizes.
+        self.cache_voice = command if isinstance(command, str) else ' '.join(command)
+
+    def synthesize(self, text, audio_cache):
+        tmp_path = audio_cache.temp_path()
+        args = [arg.replace("{output}", str(tmp_path)) for arg in self.args]
+        if shutil.which(args[0]) is None:
+            raise RuntimeError(f"{args[0]} is not installed; install it or set TTS_LOCAL_COMMAND")
+        try:
+            subprocess.run(args, input=text.encode('utf-8'), check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            tmp_path.unlink(missing_ok=True)
+            raise RuntimeError(e.stderr.decode('utf-8', 'replace').strip() or f"{args[0]} exited with {e.returncode}") from None
+        return tmp_path
+
+
+PROVIDERS = {
+    "openai": OpenAIVoice,
+    "narakeet": NarakeetVoice,
+    "elevenlabs": ElevenLabsVoice,
+    "local": LocalVoice,
+}
+
+
+def voice_for(default):
+    """The voice to use where a script would use default, honouring TTS_PROVIDER."""
+    if TTS_PROVIDER and TTS_PROVIDER != default.provider:
+        return PROVIDERS[TTS_PROVIDER]()
+    return default
+
+
+@metrics.timed("fetch_audio")
+def speak(voice, text, audio_dir):
+    """Return the cached file name of text spoken by voice, synthesizing it on a miss, or None."""
+    text = clean_text(text)
+    try:
+        audio_cache = open_cache(audio_dir)
+
+        def produce():
+            with provider_slot(voice.provider):
+                return voice.synthesize(text, audio_cache)
+
+        return audio_cache.fetch(voice.provider, voice.cache_voice, text, voice.extension, produce)
+    except Exception as e:
+        print(f"Error generating audio for '{text}': {e}")
+        return None
+
+
+def speak_all(voice, texts, audio_dir):
+    """speak() every text, as many at once as the provider allows; return the file names in order."""
+    texts = list(texts)
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency(voice.provider), len(texts)))) as executor:
+        return list(executor.map(lambda text: speak(voice, text, audio_dir), texts))
+
+
+def can_pair(voice):
+    return TTS_PAIR and hasattr(voice, "synthesize_pair") and audio_split.available()
+
+
+@metrics.timed("fetch_audio_pair")
+def speak_pair(voice, first, second, audio_dir, second_audio_dir=None):
+    """Return the cached file names of first and second, synthesizing both in one request on a miss.
+
+    second goes to second_audio_dir when given, else to audio_dir.
+    """
+    first, second = clean_text(first), clean_text(second)
+    first_cache = open_cache(audio_dir)
+    second_cache = open_cache(second_audio_dir or audio_dir)
+    # Pairing only pays off when both clips are missing.
+    if (not can_pair(voice) or first == second
+            or first_cache.get(voice.provider, voice.cache_voice, first)
+            or second_cache.get(voice.provider, voice.cache_voice, second)):
+        return speak(voice, first, audio_dir), speak(voice, second, second_audio_dir or audio_dir)
+
+    split = {}
+
+    def produce_first():
+        with provider_slot(voice.provider):
+            clip = voice.synthesize_pair(first, second, first_cache)
+        if not clip:
+            return None
+        if not isinstance(clip, Path):
+            clip_path = first_cache.temp_path()
+            clip_path.write_bytes(clip)
+            clip = clip_path
+        first_path, second_path = first_cache.temp_path(), second_cache.temp_path()
+        try:
+            if audio_split.split_at_pause(clip, first_path, second_path, voice.extension):
+                metrics.count("tts_pair.split")
+                split["second"] = second_path
+                return first_path
+        except RuntimeError as e:
+            print(f"Could not split the audio for '{first}': {e}")
+        finally:
+            clip.unlink(missing_ok=True)
+        metrics.count("tts_pair.fallback")
+        first_path.unlink(missing_ok=True)
+        second_path.unlink(missing_ok=True)
+        with provider_slot(voice.provider):
+            return voice.synthesize(first, first_cache)
+
+    def produce_second():
+        if "second" in split:
+            return split.pop("second")
+        with provider_slot(voice.provider):
+            return voice.synthesize(second, second_cache)
+
+    files = []
+    for audio_cache, text, produce in ((first_cache, first, produce_first), (second_cache, second, produce_second)):
+        try:
+            files.append(audio_cache.fetch(voice.provider, voice.cache_voice, text, voice.extension, produce))
+        except Exception as e:
+            print(f"Error generating audio for '{text}': {e}")
+            files.append(None)
+    # Another caller cached second in the meantime.
+    if "second" in split:
+        split.pop("second").unlink(missing_ok=True)
+    return tuple(files)
+
+
+def speak_pairs(voice, pairs, audio_dir, second_audio_dir=None):
+    """speak_pair() every (first, second) pair, as many at once as the provider allows; return the file name pairs in order."""
+    pairs = list(pairs)
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency(voice.provider), len(pairs)))) as executor:
+        return list(executor.map(lambda pair: speak_pair(voice, pair[0], pair[1], audio_dir, second_audio_dir), pairs))
@@ -0,0 +1,88 @@
+"""Streaming readers for word lists.
+
+read_words yields (nepali, english) pairs one line at a time from a plain
+word list, a word list plus a line-aligned translation file, or a TSV/CSV
+file with the word in the first column and an optional translation in the
+second. Nothing is read ahead, so memory stays flat on very large
+frequency lists and callers can start working on the first words while the
+rest of the file is still unread.
+
+Problems are reported per line through on_error and the line is skipped,
+rather than rejecting the whole file. Repeated words are dropped as they
+are seen.
+"""
+import csv
+import itertools
+from pathlib import Path
+
+DELIMITERS = {'.tsv': '\t', '.csv': ','}
+
+
+def report_error(path, line_no, message):
+    print(f"{path}:{line_no}: {message}")
+
+
+def read_lines(path):
+    """Yield (line number, stripped line) for path."""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line_no, line in enumerate(f, start=1):
+            yield line_no, line.strip()
+
+
+def read_aligned(words_path, translations_path, on_error=report_error):
+    """Yield (line number, word, translation) from two line-aligned files."""
+    missing = object()
+    pairs = itertools.zip_longest(read_lines(words_path), read_lines(translations_path), fillvalue=missing)
+    for word_line, translation_line in pairs:
+        if word_line is missing:
+            line_no, _ = translation_line
+            on_error(translations_path, line_no, f"translation has no word in {words_path}")
+            continue
+        line_no, word = word_line
+        if translation_line is missing:
+            if word:
+                on_error(words_path, line_no, f"no translation in {translations_path}")
+            yield line_no, word, None
+        else:
+            yield line_no, word, translation_line[1] or None
+
+
+def read_delimited(path, delimiter, on_error=report_error):
+    """Yield (line number, word, translation) from a TSV or CSV file."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        for row in reader:
+            line_no = reader.line_num
+            row = [column.strip() for column in row]
+            if len(row) > 2:
+                on_error(path, line_no, f"expected at most 2 columns, got {len(row)}")
+                continue
+            yield line_no, row[0] if row else '', row[1] if len(row) > 1 and row[1] else None
+
+
+def read_words(path, translations_path=None, on_error=report_error):
+    """Yield unique (nepali, english) pairs from a word list; english may be None.
+
+    path is a plain list with one word per line (optionally with a
+    line-aligned translations_path), or a .tsv/.csv file.
+    """
+    path = Path(path)
+    if translations_path is not None:
+        rows = read_aligned(path, translations_path, on_error)
+    elif path.suffix.lower() in DELIMITERS:
+        rows = read_delimited(path, DELIMITERS[path.suffix.lower()], on_error)
+    else:
+        rows = ((line_no, word, None) for line_no, word in read_lines(path))
+
+    seen = set()
+    duplicates = 0
+    for line_no, word, translation in rows:
+        if not word:
+            continue
+        if word in seen:
+            duplicates += 1
+            continue
+        seen.add(word)
+        yield word, translation
+    if duplicates:
+        print(f"{path}: skipped {duplicates} repeated words")
@@ -0,0 +1,266 @@
+"""Long-running deck generation worker.
+
+Jobs are queued in a SQLite table (WORKER_QUEUE_FILE) by ``submit`` or
+``python cli.py submit`` and picked up by ``python cli.py worker``. The
+worker process stays up between jobs, so the API clients and their
+connection pools, the media caches, the response cache and the note store
+indexes are built once and shared by every job instead of once per run.
+
+Up to WORKER_CONCURRENCY jobs run at a time. Jobs carry an owner (a
+learner, a language, a team); the next job is taken from the owner with
+the fewest jobs running, then the one that was served longest ago, so one
+owner queueing a hundred decks cannot starve the others.
+
+Job kinds and their payloads:
+
+- ``words``: ``words`` (a list) or ``word_file`` (plus an optional
+  ``translations_file``), ``output``, and optionally ``notes_file``,
+  ``batch_size``, ``deck_id`` and ``deck_name``. Generates the missing
+  notes, as gen_cards.py does, and packages the listed words.
+- ``qa``: ``data`` (entries shaped like quick.qa_data), ``deck_id``,
+  ``deck_name`` and ``output``.
+- ``alphabet``: ``output`` and optionally ``decks``, a list of
+  ``{"deck_id", "deck_name", "rows"}`` with rows shaped like
+  gen_vowel_consonant_notes.vowels; defaults to the built-in tables.
+
+Jobs that raise are retried up to WORKER_MAX_ATTEMPTS times. A job left
+running by a worker that died is queued again when the next worker starts,
+so run one worker per queue file.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import metrics
+
+WORKER_QUEUE_FILE = Path(os.getenv("WORKER_QUEUE_FILE", "jobs.sqlite3"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+WORKER_MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "3"))
+
+Job = namedtuple("Job", "id kind owner payload attempts")
+
+class JobQueue:
+    def __init__(self, path=WORKER_QUEUE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        # Autocommit, so claim() can hold an explicit write transaction.
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_owner ON jobs (status, owner)')
+
+    def submit(self, kind, payload, owner="default"):
+        """Queue a job and return its id."""
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO jobs (kind, owner, payload, created) VALUES (?, ?, ?, ?)',
+                (kind, owner, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+            return cursor.lastrowid
+
+    def claim(self):
+        """Mark the next job running and return it, or None if the queue is empty."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('''
+                    SELECT id, kind, owner, payload, attempts FROM jobs AS j
+                    WHERE status = 'queued'
+                    ORDER BY
+                        (SELECT COUNT(*) FROM jobs WHERE owner = j.owner AND status = 'running'),
+                        (SELECT COALESCE(MAX(started), 0) FROM jobs WHERE owner = j.owner),
+                        id
+                    LIMIT 1
+                ''').fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, started = ? WHERE id = ?",
+                        (time.time(), row[0]),
+                    )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        job_id, kind, owner, payload, attempts = row
+        return Job(job_id, kind, owner, json.loads(payload), attempts + 1)
+
+    def complete(self, job_id, result):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished = ? WHERE id = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def fail(self, job_id, error, retry):
+        """Record a failed attempt, queueing the job again if retry is set."""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?',
+                ('queued' if retry else 'failed', error, time.time(), job_id),
+            )
+
+    def recover(self):
+        """Queue again the jobs a previous worker left running; return how many."""
+        with self._lock:
+            return self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'").rowcount
+
+    def jobs(self, status=None):
+        """Return the jobs as dicts, oldest first, optionally only those with status."""
+        query = 'SELECT id, kind, owner, status, attempts, result, error, created, started, finished FROM jobs'
+        params = ()
+        if status:
+            query += ' WHERE status = ?'
+            params = (status,)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY id', params).fetchall()
+        columns = ('id', 'kind', 'owner', 'status', 'attempts', 'result', 'error', 'created', 'started', 'finished')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def run_words_job(payload):
+    import gen_cards
+    from note_store import open_store
+    from word_lists import read_words
+
+    if "words" in payload:
+        words = payload["words"]
+    else:
+        words = (nepali_word for nepali_word, _ in read_words(payload["word_file"], payload.get("translations_file")))
+    words = list(dict.fromkeys(words))
+    store = open_store(payload.get("notes_file", gen_cards.notes_file))
+
+    # Jobs sharing a notes file generate side by side; the store numbers
+    # each note as it is stored, so indexes are never handed out twice.
+    pending = [nepali_word for nepali_word in words if nepali_word not in store]
+    failed = gen_cards.generate_notes(pending, payload.get("batch_size", gen_cards.BATCH_SIZE), store)
+    store.save()
+    notes = [store.get(nepali_word) for nepali_word in words if nepali_word in store]
+
+    # build_package locks the output's build cache, so jobs writing the same
+    # deck take turns there.
+    gen_cards.write_deck(notes, payload["output"], payload.get("deck_id", 2059400110), payload.get("deck_name", 'Nepali 1k'))
+    return {"output": payload["output"], "notes": len(notes), "generated": len(pending) - len(failed), "failed": failed}
+
+
+def run_qa_job(payload):
+    import quick
+    from incremental_package import DeckBuild
+
+    build = DeckBuild()
+    audio_dirs = {"question": quick.question_audio_dir, "answer": quick.answer_audio_dir}
+    quick.create_deck(build, payload["deck_id"], payload["deck_name"], quick.make_model(), payload["data"], audio_dirs)
+    build.write_package(payload["output"])
+    return {"output": payload["output"], "notes": len(payload["data"])}
+
+
+def run_alphabet_job(payload):
+    import gen_vowel_consonant_notes as alphabet
+    from incremental_package import DeckBuild
+
+    decks = payload.get("decks") or [
+        {"deck_id": deck_id, "deck_name": deck_name, "rows": rows}
+        for deck_id, deck_name, rows, _ in alphabet.ALPHABET_DECKS
+    ]
+    build = DeckBuild()
+    model = alphabet.make_model()
+    for deck in decks:
+        alphabet.add_notes_to_deck(build, model, build.add_deck(deck["deck_id"], deck["deck_name"]), deck["rows"])
+    build.write_package(payload["output"])
+    return {"output": payload["output"], "notes": sum(len(deck["rows"]) for deck in decks)}
+
+
+HANDLERS = {
+    "words": run_words_job,
+    "qa": run_qa_job,
+    "alphabet": run_alphabet_job,
+}
+
+
+def submit(kind, payload, owner="default", queue_file=WORKER_QUEUE_FILE):
+    """Queue a job on queue_file and return its id."""
+    queue = JobQueue(queue_file)
+    try:
+        return queue.submit(kind, payload, owner)
+    finally:
+        queue.close()
+
+
+class Worker:
+    def __init__(self, queue, concurrency=WORKER_CONCURRENCY, poll_seconds=WORKER_POLL_SECONDS, max_attempts=WORKER_MAX_ATTEMPTS):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.stopping = threading.Event()
+
+    def run_job(self, job):
+        print(f"Job {job.id} ({job.kind} for {job.owner}) started, attempt {job.attempts}")
+        try:
+            with metrics.timer(f"job.{job.kind}"):
+                result = HANDLERS[job.kind](job.payload)
+        except Exception as e:
+            retry = job.attempts < self.max_attempts
+            print(f"Job {job.id} failed{', will retry' if retry else ''}: {e}")
+            self.queue.fail(job.id, str(e), retry)
+            return
+        self.queue.complete(job.id, result)
+        print(f"Job {job.id} done: {result.get('output')}")
+
+    def run(self, exit_when_idle=False):
+        """Process jobs until stop() is called, or until the queue is empty with exit_when_idle."""
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"Requeued {recovered} jobs left running by a previous worker")
+        print(f"Worker started on {self.queue.path} with {self.concurrency} job slots")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            running = set()
+            try:
+                while True:
+                    while len(running) < self.concurrency and not self.stopping.is_set():
+                        job = self.queue.claim()
+                        if job is None:
+                            break
+                        running.add(executor.submit(self.run_job, job))
+                    if not running and (exit_when_idle or self.stopping.is_set()):
+                        break
+                    if running:
+                        _, running = wait(running, timeout=self.poll_seconds, return_when=FIRST_COMPLETED)
+                    else:
+                        self.stopping.wait(self.poll_seconds)
+            except KeyboardInterrupt:
+                print(f"Stopping; waiting for {len(running)} running jobs")
+                self.stop()
+                wait(running)
+
+    def stop(self):
+        """Stop taking new jobs; running jobs are finished first."""
+        self.stopping.set()